@@ -1,40 +1,139 @@
-﻿from flask import Flask, request, jsonify
-from datetime import datetime
-import random, re, os, json
+﻿import time
+BOOT_STARTED = time.perf_counter()
+from flask import Flask, Response, request, jsonify, url_for, stream_with_context, has_request_context, g
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
+from datetime import datetime, timedelta
+import random, re, os, json, base64, hmac
+import threading, tempfile, atexit, queue, copy, bisect, gzip, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps, partial, lru_cache
+import contextvars
+from collections import OrderedDict, deque
 from html import escape as html_escape
-from PIL import Image
 from io import BytesIO
-import firebase_admin
-from firebase_admin import credentials, db
+import click
+from storage import create_storage, new_push_id
+
+# Accélérateurs optionnels : sérialisation orjson et compression brotli
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 
 # ---------------------------------------------------------------------
-# 🔧 1. Création automatique de la clé Firebase AVANT toute initialisation
+# ⏱️ Rapport de démarrage
 # ---------------------------------------------------------------------
-if os.getenv("FIREBASE_KEY_JSON"):
-    try:
-        key_content = json.loads(os.getenv("FIREBASE_KEY_JSON"))
-        os.makedirs("config", exist_ok=True)
-        with open("config/serviceAccountKey.json", "w") as f:
-            json.dump(key_content, f)
-        print("✅ serviceAccountKey.json recréé avec succès !")
-    except Exception as e:
-        print("⚠️ Erreur lors de la création du fichier Firebase :", e)
-else:
-    print("⚠️ Variable FIREBASE_KEY_JSON non trouvée dans Render !")
+# Durée de chaque phase (import du module, puis préchauffage en arrière-plan),
+# affichée dans les logs et renvoyée par /ready.
+class StartupReport:
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = OrderedDict()
+        self.errors = {}
+        self._last = started
+
+    def mark(self, phase: str):
+        # Phase séquentielle de l'import : depuis la marque précédente
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def timed(self, phase: str, fn):
+        started = time.perf_counter()
+        try:
+            return fn()
+        except Exception as e:
+            self.errors[phase] = str(e)
+            raise
+        finally:
+            self.phases[phase] = round((time.perf_counter() - started) * 1000, 1)
+
+    def summary(self) -> str:
+        return ", ".join(f"{phase} {ms} ms" for phase, ms in self.phases.items())
+
+
+STARTUP = StartupReport(BOOT_STARTED)
+STARTUP.mark("imports")
+
+# Moteur de stockage : "firebase" (Realtime Database) ou "sqlite" (fichier local)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/anniv.sqlite3")
 
 # ---------------------------------------------------------------------
-# 🔥 2. Initialisation Firebase
+# 🔧 1. Clé Firebase : lue en mémoire depuis FIREBASE_KEY_JSON (aucun fichier écrit),
+#    sinon config/serviceAccountKey.json pour le développement local
 # ---------------------------------------------------------------------
+# Règles Realtime Database : database.rules.json déclare les ".indexOn" des requêtes
+# ordonnées (Firebase refuse sinon "Index not defined"). À déployer avec
+#   firebase deploy --only database
+# Le serveur passe par le SDK Admin, qui ignore ".read"/".write" : l'accès client est fermé.
 SERVICE_KEY_PATH = "config/serviceAccountKey.json"
 DATABASE_URL = os.getenv("FIREBASE_DATABASE_URL", "https://android-92c2b-default-rtdb.firebaseio.com")
 
-cred = credentials.Certificate(SERVICE_KEY_PATH)
-firebase_admin.initialize_app(cred, {"databaseURL": DATABASE_URL})
+def load_firebase_credential():
+    if os.getenv("FIREBASE_DB_MODULE"):
+        return None
+    if os.getenv("FIREBASE_KEY_JSON"):
+        try:
+            return json.loads(os.getenv("FIREBASE_KEY_JSON"))
+        except ValueError as e:
+            print("⚠️ FIREBASE_KEY_JSON invalide :", e)
+    elif STORAGE_BACKEND == "firebase" and not os.path.exists(SERVICE_KEY_PATH):
+        print("⚠️ Variable FIREBASE_KEY_JSON non trouvée dans Render !")
+    return SERVICE_KEY_PATH
+
+# ---------------------------------------------------------------------
+# 🔥 2. Stockage (Firebase ou SQLite), connecté au premier accès ou au préchauffage
+# ---------------------------------------------------------------------
+store = create_storage(
+    STORAGE_BACKEND,
+    credential=load_firebase_credential() if STORAGE_BACKEND == "firebase" else None,
+    database_url=DATABASE_URL,
+    firebase_db_module=os.getenv("FIREBASE_DB_MODULE"),
+    sqlite_path=SQLITE_PATH,
+)
+STARTUP.mark("config")
 
 # ---------------------------------------------------------------------
 # 🚀 3. Application Flask
 # ---------------------------------------------------------------------
+class FastJSONProvider(DefaultJSONProvider):
+    # orjson quand il est installé (clés triées et dates HTTP comme le fournisseur
+    # standard), sinon json de la bibliothèque standard. Temps CPU compté par route.
+    ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME) if orjson else 0
+
+    def encode(self, obj) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self.ORJSON_OPTIONS)
+            except TypeError:
+                pass  # entier hors 64 bits, type inconnu... : repli sur json
+        return super().dumps(obj, separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        started = time.thread_time()
+        body = self.encode(obj) + b"\n"
+        if has_request_context():
+            RESPONSE_STATS.add(request.endpoint, serialize_cpu_s=time.thread_time() - started)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 @app.after_request
 def add_cors_headers(response):
@@ -66,28 +165,168 @@ def build_quiz(celebrant: str):
         {"question": f"Année de naissance de {celebrant} ? (a) 1990 (b) 1995 (c) 2000", "answer": "b"},
     ]
 
+# ---------------------------------------------------------------------
+# Cache LRU avec expiration
+# ---------------------------------------------------------------------
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_KEY_UNSAFE = re.compile(r"[.$#\[\]/%\x00-\x1f\x7f]")
+
+def name_key(name: str) -> str:
+    # Clé Firebase du nom normalisé (casse et espaces ignorés, caractères interdits encodés)
+    normalized = " ".join((name or "").split()).lower()
+    return _KEY_UNSAFE.sub(lambda m: "%%%02X" % ord(m.group()), normalized)
+
+def is_safe_key(key: str) -> bool:
+    # Identifiant fourni par le client et utilisé tel quel comme segment de chemin
+    return bool(key) and not _KEY_UNSAFE.search(key)
+
+
+# ---------- Migrations de données ----------
+# Reprises ponctuelles de l'existant (index construits après coup) : chacune est idempotente,
+# lancée au préchauffage tant que son marqueur meta/migrations/<nom> n'existe pas
+# (ou à la main : flask migrate).
+MIGRATIONS = OrderedDict()
+_migrations_done = set()
+
+def migration(name: str):
+    def register(fn):
+        MIGRATIONS[name] = fn
+        return fn
+    return register
+
+def migration_done(name: str) -> bool:
+    if name in _migrations_done:
+        return True
+    if store.get(f"meta/migrations/{name}"):
+        _migrations_done.add(name)
+        return True
+    return False
+
+def run_migrations(force: bool = False):
+    summary = {}
+    for name, fn in MIGRATIONS.items():
+        if not force and migration_done(name):
+            continue
+        summary[name] = fn()
+        store.set(f"meta/migrations/{name}", datetime.utcnow().isoformat())
+        _migrations_done.add(name)
+    return summary
+
+@app.cli.command("migrate")
+@click.option("--force", is_flag=True, help="Relancer aussi les migrations déjà faites.")
+def migrate_command(force):
+    click.echo(json.dumps(run_migrations(force)))
+
+
+# ---------- Utilisateurs ----------
+# Index users_by_name/<nom normalisé> -> user_id, maintenu par create_user ; les noms
+# inconnus sont aussi retenus (USER_MISS_TTL) pour ne pas relire l'index à chaque visite.
+USER_IDS = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("USER_CACHE_TTL", 600)),
+)
+USER_MISS_TTL = float(os.getenv("USER_MISS_TTL", 30))
+UNKNOWN_USER = ""
+
+def get_user_id_by_name(name: str):
+    # Lecture seule : une lecture de l'index (plus l'ancienne requête tant que l'index
+    # n'est pas complet), jamais d'écriture
+    key = name_key(name)
+    if not key:
+        return None
+    user_id = USER_IDS.get(key)
+    if user_id is None:
+        user_id = store.get(f"users_by_name/{key}") or legacy_user_id(name, key) or UNKNOWN_USER
+        USER_IDS.set(key, user_id, ttl=None if user_id else USER_MISS_TTL)
+    return user_id or None
+
+def legacy_user_id(name: str, key: str):
+    # Migration users_by_name pas encore faite : recherche par "name" comme avant l'index
+    if migration_done("users_by_name"):
+        return None
+    for candidate in dict.fromkeys([name, " ".join(name.split()), name.strip().capitalize()]):
+        for user_id, user in (store.query("users", "name", equal_to=candidate) or {}).items():
+            if name_key((user or {}).get("name") or "") == key:
+                return user_id
+    return None
+
+@migration("users_by_name")
+def backfill_user_index():
+    # Utilisateurs créés avant l'index : un seul parcours de users, par nom normalisé
+    users = store.get("users") or {}
+    index = store.get("users_by_name") or {}
+    added = 0
+    for user_id, user in users.items():
+        key = name_key((user or {}).get("name") or "")
+        if not key or key in index:
+            continue
+        index[key] = store.transaction(f"users_by_name/{key}", lambda cur, uid=user_id: cur or uid)
+        added += index[key] == user_id
+    USER_IDS.clear()
+    return {"users": len(users), "indexed": added}
+
 def get_user_by_name(name: str):
-    ref = db.reference("users")
-    snap = ref.order_by_child("name").equal_to(name).get()
-    if snap:
-        user_id = list(snap.keys())[0]
-        user_data = snap[user_id]
-        return user_id, user_data
-    return None, None
+    user_id = get_user_id_by_name(name)
+    if user_id is None:
+        return None, None
+    user_data = store.get(f"users/{user_id}")
+    if user_data is None:
+        return None, None
+    return user_id, user_data
 
 def create_user(name: str):
-    ref = db.reference("users")
-    new_ref = ref.push({
-        "name": name,
-        "step": "quiz_q1",
-        "score": 0,
-        "created_at": datetime.utcnow().isoformat(),
-    })
-    return new_ref.key
+    # Création sans doublon : le premier qui réserve l'entrée de l'index gagne
+    key = name_key(name)
+    candidate = new_push_id()
+    user_id = store.transaction(f"users_by_name/{key}", lambda cur: cur or candidate)
+    if user_id == candidate or store.get(f"users/{user_id}") is None:
+        store.set(f"users/{user_id}", {
+            "name": name,
+            "step": "quiz_q1",
+            "score": 0,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+    USER_IDS.set(key, user_id)
+    return user_id
 
 def update_user(user_id: str, data: dict):
-    ref = db.reference(f"users/{user_id}")
-    ref.update(data)
+    store.update(f"users/{user_id}", data)
 
 def sanitize_text(s: str, max_len: int = 300) -> str:
     s = (s or "").strip()
@@ -95,40 +334,1220 @@ def sanitize_text(s: str, max_len: int = 300) -> str:
         s = s[:max_len]
     return html_escape(s, quote=False)
 
+def parse_limit(value, default: int, maximum: int) -> int:
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
 
 
-# ---------- Wishes ----------
-def add_wish(name: str, message: str):
-    ref = db.reference("wishes")
-    new_ref = ref.push(
-        {
-            "name": name,
-            "message": message,
-            "hearts": 0,
-            "created_at": datetime.utcnow().isoformat(),
+# ---------- Pagination par curseur ----------
+# Curseur opaque "<created_at>_<clé>" du dernier élément renvoyé
+def make_cursor(key: str, item: dict) -> str:
+    return f"{item.get('created_at') or ''}_{key}"
+
+def split_cursor(cursor: str):
+    created_at, _, key = (cursor or "").partition("_")
+    return created_at, key
+
+def page_by_created_at(path: str, limit: int, cursor: str = None, newest_first: bool = True):
+    # Requête ordonnée et limitée côté serveur (".indexOn": "created_at") ;
+    # on lit limit + 2 entrées : l'élément du curseur et de quoi savoir s'il reste une page
+    mirror = mirror_for(path)
+    if mirror is not None:
+        return mirror.page_by_created_at(limit, cursor, newest_first)
+    position = split_cursor(cursor) if cursor else None
+    if newest_first:
+        end_at = position[0] if position else None
+        rows = list(store.query(path, "created_at", end_at=end_at, limit_to_last=limit + 2).items())
+        rows.reverse()
+    else:
+        start_at = position[0] if position else None
+        rows = list(store.query(path, "created_at", start_at=start_at, limit_to_first=limit + 2).items())
+
+    items = []
+    for key, value in rows:
+        value = value or {}
+        if position:
+            here = (value.get("created_at") or "", key)
+            if (here >= position) if newest_first else (here <= position):
+                continue
+        value["id"] = key
+        items.append(value)
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = make_cursor(items[-1]["id"], items[-1])
+    return items, next_cursor
+
+
+
+# ---------- Miroirs locaux ----------
+# Noeuds lus bien plus souvent qu'écrits : une copie en mémoire par processus est
+# tenue à jour par un listen() Firebase (un seul par noeud). Les lectures la servent
+# tant que l'écoute est saine, sinon elles repartent vers Firebase.
+MIRROR_NODES = [p for p in os.getenv("MIRROR_NODES", "quiz/questions,polls,gallery,wishes").split(",") if p]
+MIRROR_STRIP = {"gallery": ("image_data",)}
+MIRROR_RETRY_MAX = float(os.getenv("MIRROR_RETRY_MAX", 60))
+
+
+class NodeMirror:
+    def __init__(self, path: str, strip=()):
+        self.path = path
+        self.strip = strip
+        self.loaded = False
+        self.events = 0
+        self.errors = 0
+        self.last_event_at = None
+        self._lock = threading.Lock()
+        self._data = {}
+        self._index = []
+        self._index_dirty = True
+        self._registration = None
+        self._starting = False      # appel listen() en cours
+        self._attempts = 0          # (re)démarrages depuis le dernier chargement réussi
+        self._retry_at = 0.0
+
+    def start(self):
+        # (Re)abonnement : une écoute morte est fermée puis relancée, avec un délai
+        # doublé à chaque échec (jusqu'à MIRROR_RETRY_MAX) tant qu'aucun chargement n'aboutit
+        with self._lock:
+            now = time.monotonic()
+            if self._starting or now < self._retry_at:
+                return
+            if self._registration is not None and self._listening():
+                return
+            self._starting = True
+            stale, self._registration = self._registration, None
+            self.loaded = False
+            self._retry_at = now + min(MIRROR_RETRY_MAX, 0.5 * 2 ** self._attempts)
+            self._attempts += 1
+        if stale is not None:
+            self._close(stale)
+        threading.Thread(target=self._listen, name=f"mirror:{self.path}", daemon=True).start()
+
+    def _listen(self):
+        try:
+            self._registration = store.listen(self.path, self._on_event)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Miroir {self.path} indisponible :", e)
+        finally:
+            self._starting = False
+
+    def _listening(self) -> bool:
+        thread = getattr(self._registration, "_thread", None)
+        return thread is None or thread.is_alive()
+
+    def _close(self, registration):
+        try:
+            registration.close()
+        except Exception as e:
+            print(f"⚠️ Fermeture de l'écoute {self.path} :", e)
+
+    def stop(self):
+        if self._registration is not None:
+            self._close(self._registration)
+            self._registration = None
+        self.loaded = False
+        self._starting = False
+        self._attempts, self._retry_at = 0, 0.0
+
+    def after_fork(self):
+        # Le thread d'écoute du parent n'existe pas dans le worker : on repart de zéro
+        self._lock = threading.Lock()
+        self._registration = None
+        self.loaded = False
+        self._starting = False
+        self._attempts, self._retry_at = 0, 0.0
+
+    def healthy(self) -> bool:
+        return self.loaded and self._registration is not None and self._listening()
+
+    def _clean(self, key, value):
+        if self.strip and isinstance(value, dict):
+            for field in self.strip:
+                value.pop(field, None)
+        return value
+
+    def _apply(self, parts, value):
+        if not parts:
+            data = value if isinstance(value, dict) else {}
+            self._data = {k: self._clean(k, v) for k, v in data.items()}
+            return
+        node = self._data
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                if value is None:
+                    return
+                child = node[part] = {}
+            node = child
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = self._clean(parts[-1], value) if len(parts) == 1 else value
+
+    def _on_event(self, event):
+        try:
+            parts = [p for p in (event.path or "/").split("/") if p]
+            with self._lock:
+                if event.event_type == "patch":
+                    for sub, value in (event.data or {}).items():
+                        self._apply(parts + [p for p in sub.split("/") if p], value)
+                else:
+                    self._apply(parts, event.data)
+                # L'index trié ne change que si un enfant apparaît/disparaît ou change de date
+                if len(parts) <= 1 or "created_at" in parts or event.event_type == "patch":
+                    self._index_dirty = True
+                if not parts and event.event_type != "patch":
+                    self.loaded = True
+                    self._attempts, self._retry_at = 0, 0.0
+                self.events += 1
+                VERSIONS.bump(self.path)
+                self.last_event_at = time.time()
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Événement ignoré sur le miroir {self.path} :", e)
+
+    def get(self, *parts):
+        with self._lock:
+            node = self._data
+            for part in parts:
+                if not isinstance(node, dict):
+                    return None
+                node = node.get(part)
+            return copy.deepcopy(node)
+
+    def page_by_created_at(self, limit: int, cursor: str = None, newest_first: bool = True):
+        # Même ordre et même curseur que la requête Firebase : (created_at, clé)
+        position = split_cursor(cursor) if cursor else None
+        with self._lock:
+            if self._index_dirty:
+                self._index = sorted(
+                    ((v.get("created_at") or "") if isinstance(v, dict) else "", k)
+                    for k, v in self._data.items()
+                )
+                self._index_dirty = False
+            if newest_first:
+                end = bisect.bisect_left(self._index, position) if position else len(self._index)
+                window = self._index[max(0, end - limit - 1):end][::-1]
+            else:
+                start = bisect.bisect_right(self._index, position) if position else 0
+                window = self._index[start:start + limit + 1]
+            items = [dict(copy.deepcopy(self._data[k] or {}), id=k) for _, k in window]
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = make_cursor(items[-1]["id"], items[-1])
+        return items, next_cursor
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "healthy": self.healthy(),
+            "events": self.events,
+            "errors": self.errors,
+            "children": len(self._data),
+            "staleness_s": None if self.last_event_at is None else round(time.time() - self.last_event_at, 3),
         }
+
+
+MIRRORS = {path: NodeMirror(path, MIRROR_STRIP.get(path, ())) for path in MIRROR_NODES}
+
+def mirror_for(path: str):
+    mirror = MIRRORS.get(path) if store.supports_listen else None
+    if mirror is None:
+        return None
+    if not mirror.healthy():
+        mirror.start()
+        return None
+    return mirror
+
+def read_node(path: str):
+    # Lecture d'un chemin sous un noeud mirroré (ex. polls/<id>), sinon lecture directe
+    for root, mirror in MIRRORS.items():
+        if path.startswith(root + "/") and mirror_for(root) is not None:
+            return mirror.get(*path[len(root) + 1:].split("/"))
+    return store.get(path)
+
+
+# ---------- Cache HTTP (ETag / 304) ----------
+# Chaque noeud (wishes, gallery, leaderboard, quiz/questions, quiz/best...) porte un
+# compteur de version, incrémenté à chaque écriture passant par store et à chaque
+# événement de miroir. L'ETag d'une liste en dérive : un If-None-Match identique
+# reçoit un 304 sans aucune lecture. Sans miroir sain, on ne voit pas les écritures
+# des autres processus : l'ETag inclut alors une tranche de max-age secondes.
+# HTTP_CACHE='{"wishes": [5, 30]}' ajuste max-age / stale-while-revalidate par route.
+CACHE_RULES = {
+    "wishes": (5, 30),
+    "gallery": (10, 60),
+    "leaderboard": (5, 30),
+    "quiz_questions": (30, 300),
+    "quiz_leaderboard": (10, 60),
+    "countdown": (30, 60),
+}
+CACHE_RULES.update({k: tuple(v) for k, v in json.loads(os.getenv("HTTP_CACHE") or "{}").items()})
+RESPONSE_CACHE = TTLCache(maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", 512)), ttl=60)
+
+
+def node_of(path: str) -> str:
+    parts = [p for p in path.split("/") if p]
+    if parts[:1] == ["quiz"]:
+        return "/".join(parts[:2])
+    return parts[0] if parts else ""
+
+
+class NodeVersions:
+    def __init__(self):
+        self.instance = new_push_id()[-6:]
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._modified = {}
+
+    def bump(self, path: str):
+        # "" (écriture à la racine) invalide tous les noeuds
+        node = node_of(path)
+        with self._lock:
+            self._versions[node] = self._versions.get(node, 0) + 1
+            self._modified[node] = time.time()
+
+    def tag(self, nodes) -> str:
+        with self._lock:
+            return ".".join(str(self._versions.get(n, 0)) for n in ("",) + nodes)
+
+    def last_modified(self, nodes) -> datetime:
+        with self._lock:
+            stamp = max(self._modified.get(n, self.started_at) for n in ("",) + nodes)
+        return datetime.utcfromtimestamp(int(stamp))
+
+
+VERSIONS = NodeVersions()
+
+@store.on_write
+def bump_written_nodes(paths):
+    for path in paths:
+        VERSIONS.bump(path)
+
+
+def mirrored(node: str) -> bool:
+    mirror = MIRRORS.get(node)
+    return store.supports_listen and mirror is not None and mirror.healthy()
+
+
+def http_cached(rule: str, *nodes):
+    max_age, swr = CACHE_RULES[rule]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            etag = f"{rule}-{VERSIONS.instance}-{VERSIONS.tag(nodes)}"
+            if not nodes or not all(mirrored(n) for n in nodes):
+                etag += f"-{int(time.time() // max(max_age, 1))}"
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                key = (request.path, request.query_string)
+                cached = RESPONSE_CACHE.get(key)
+                if cached is not None and cached[0] == etag:
+                    response = app.response_class(cached[1], mimetype=cached[2])
+                else:
+                    response = app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    RESPONSE_CACHE.set(key, (etag, response.get_data(), response.mimetype), ttl=max_age + swr)
+            response.set_etag(etag, weak=True)
+            response.last_modified = VERSIONS.last_modified(nodes)
+            response.headers["Cache-Control"] = f"public, max-age={max_age}, stale-while-revalidate={swr}"
+            return response
+        return wrapper
+    return decorator
+
+
+# ---------- Métriques (Prometheus) ----------
+# Chaque requête (route, méthode, statut, latence) et chaque appel au stockage
+# (opération, noeud, durée, octets) alimentent des compteurs et histogrammes en
+# mémoire, exposés au format texte Prometheus sur /metrics. SLOW_REQUEST_MS > 0
+# journalise les requêtes lentes avec le détail de leurs appels au stockage.
+# METRICS_PAYLOAD_BYTES=1 ajoute une estimation des octets échangés avec le stockage.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+METRICS_PAYLOAD_BYTES = os.getenv("METRICS_PAYLOAD_BYTES", "0") == "1"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def metric_labels(labels) -> str:
+    if not labels:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    HELP = {
+        "http_requests_total": ("counter", "Requêtes HTTP par route, méthode et statut"),
+        "http_request_duration_seconds": ("histogram", "Latence des requêtes HTTP"),
+        "storage_call_duration_seconds": ("histogram", "Durée des appels au stockage"),
+        "storage_errors_total": ("counter", "Appels au stockage en erreur"),
+        "storage_payload_bytes_total": ("counter", "Octets lus ou écrits par appel au stockage (estimation)"),
+    }
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}     # (nom, labels) -> valeur
+        self._histograms = {}   # (nom, labels) -> [effectif par borne..., au-delà, somme, total]
+
+    def inc(self, name: str, labels: tuple, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, labels: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            histogram[index] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self, families=()) -> str:
+        # families : [(nom, type, aide, [(labels, valeur), ...])] calculées à la demande
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(h) for key, h in self._histograms.items()}
+        lines, described = [], set()
+
+        def describe(name, kind, text):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, *self.HELP.get(name, ("counter", name)))
+            lines.append(f"{name}{metric_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            describe(name, *self.HELP.get(name, ("histogram", name)))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{metric_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{metric_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+            lines.append(f"{name}_sum{metric_labels(labels)} {histogram[-2]}")
+            lines.append(f"{name}_count{metric_labels(labels)} {histogram[-1]}")
+        for name, kind, text, samples in families:
+            describe(name, kind, text)
+            for labels, value in samples:
+                lines.append(f"{name}{metric_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics(LATENCY_BUCKETS)
+
+
+def payload_size(value) -> int:
+    # Estimation sans sérialiser : longueur des clés et des chaînes, 8 octets par autre valeur.
+    # Le coût dépend du nombre de noeuds, pas de leur taille (images base64 comprises).
+    size, stack = 0, [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, dict):
+            size += sum(len(str(key)) for key in value)
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif value is not None:
+            size += 8
+    return size
+
+
+@store.on_call
+def record_storage_call(op, path, seconds, payload, failed):
+    labels = (("op", op), ("node", node_of(path) or "/"))
+    METRICS.observe("storage_call_duration_seconds", labels, seconds)
+    if failed:
+        METRICS.inc("storage_errors_total", labels)
+    if METRICS_PAYLOAD_BYTES:
+        METRICS.inc("storage_payload_bytes_total", labels, payload_size(payload))
+    if has_request_context() and "storage_calls" in g:
+        g.storage_calls.append((op, path, seconds))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.storage_calls = []
+
+
+@app.after_request
+def record_request(response):
+    started = g.get("request_started")
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    METRICS.inc("http_requests_total", (("route", route), ("method", request.method), ("status", str(response.status_code))))
+    METRICS.observe("http_request_duration_seconds", (("route", route), ("method", request.method)), seconds)
+    if SLOW_REQUEST_MS and seconds * 1000 >= SLOW_REQUEST_MS:
+        calls = ", ".join(f"{op} /{path} {s * 1000:.1f} ms" for op, path, s in g.storage_calls)
+        print(f"🐢 {request.method} {request.full_path.rstrip('?')} {response.status_code} {seconds * 1000:.0f} ms "
+              f"({len(g.storage_calls)} appel(s) au stockage) {calls}")
+    return response
+
+
+# ---------- Compression des réponses ----------
+# gzip (ou brotli si installé et accepté) au-delà de COMPRESS_MIN_BYTES, pour le JSON
+# et le texte. Les corps compressés sont gardés par empreinte du contenu : une liste
+# servie depuis RESPONSE_CACHE n'est compressée qu'une fois.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 5))
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+COMPRESSED_BODIES = TTLCache(maxsize=int(os.getenv("COMPRESSED_CACHE_SIZE", 256)), ttl=300)
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+class ResponseStats:
+    # Compteurs par route : réponses, octets avant/après compression, CPU JSON/compression
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def add(self, route, **amounts):
+        with self._lock:
+            totals = self._routes.setdefault(route or "-", {})
+            for field, amount in amounts.items():
+                totals[field] = totals.get(field, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self._routes)
+
+
+RESPONSE_STATS = ResponseStats()
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    route = request.endpoint
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+        return response
+    body = response.get_data()
+    encoding = None
+    if len(body) >= COMPRESS_MIN_BYTES:
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        RESPONSE_STATS.add(route, responses=1, bytes_raw=len(body), bytes_sent=len(body))
+        return response
+
+    key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+    started = time.thread_time()
+    packed = COMPRESSED_BODIES.get(key)
+    reused = packed is not None
+    if not reused:
+        packed = compress_body(body, encoding)
+        COMPRESSED_BODIES.set(key, packed)
+    if len(packed) < len(body):
+        response.set_data(packed)
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    RESPONSE_STATS.add(
+        route, responses=1, compressed=1, compressed_reused=int(reused),
+        bytes_raw=len(body), bytes_sent=response.content_length or len(packed),
+        compress_cpu_s=time.thread_time() - started,
     )
-    return new_ref.key
+    return response
 
 
-def list_wishes():
-    ref = db.reference("wishes")
-    data = ref.get() or {}
-    items = []
-    for k, v in data.items():
-        v = v or {}
-        v["id"] = k
-        items.append(v)
-    # Tri par date de création décroissante (du plus récent au plus ancien)
-    items.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return items
+# ---------- Lectures concurrentes (fan-out) ----------
+# Pool partagé et borné pour les lectures indépendantes d'une même requête : la
+# latence devient celle de l'appel le plus lent au lieu de la somme des allers-retours.
+# Chaque appel tourne dans une copie du contexte courant (request, g : ses appels au
+# stockage restent attribués à la requête) et dispose de FANOUT_TIMEOUT secondes.
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 16))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", 10))
+
+def new_fanout_pool():
+    return ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout") if FANOUT_WORKERS > 0 else None
+
+FANOUT_POOL = new_fanout_pool()
+
+def gather(*calls, timeout: float = None):
+    # calls : fonctions sans argument ; résultats dans l'ordre, première exception propagée.
+    # Séquentiel sans pool, pour un appel unique ou depuis un thread du pool (pas d'interblocage).
+    if FANOUT_POOL is None or len(calls) < 2 or threading.current_thread().name.startswith("fanout"):
+        return [call() for call in calls]
+    timeout = FANOUT_TIMEOUT if timeout is None else timeout
+    futures = [FANOUT_POOL.submit(contextvars.copy_context().run, call) for call in calls]
+    deadline = time.monotonic() + timeout
+    try:
+        return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+@app.errorhandler(TimeoutError)
+def backend_timeout(e):
+    return jsonify({"error": "backend timeout"}), 504
+
+
+# ---------- Écritures différées (write-behind) ----------
+# Les écritures fréquentes (scores, records memory, votes, scores de quiz) sont
+# regroupées pendant WRITE_BEHIND_MS puis envoyées en un seul update() multi-chemins :
+# deltas de score additionnés, meilleur temps = min, votes dédoublonnés par votant.
+# WRITE_BEHIND_MS=0 écrit immédiatement (mode synchrone, pour les tests).
+def server_increment(delta: int):
+    return {".sv": {"increment": delta}}
+
+
+class WriteBehindQueue:
+    def __init__(self, window_ms: int, max_pending: int):
+        self.window = window_ms / 1000.0
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._listeners = []
+        self._inflight = []     # lots retirés de la file, en cours d'écriture
+        # Score stocké par joueur ([valeur]), ajusté à chaque écriture réussie de ce joueur.
+        # TTL de l'ordre de la fenêtre de flush : les deltas des autres workers arrivent vite.
+        self._known = TTLCache(maxsize=4096, ttl=self.window or 0.2)
+        self._score_writes = {}     # user_id -> écritures de score terminées
+        self._reset()
+
+    def _reset(self):
+        self._scores = {}   # user_id -> [name, delta]
+        self._memory = {}   # user_id -> [name, best_time_ms]
+        self._votes = {}    # (poll_id, user_id) -> option_id
+        self._sets = {}     # chemin -> valeur
+        self._increments = {}   # chemin -> delta (compteurs, incrément côté serveur)
+
+    def pending(self) -> int:
+        return len(self._scores) + len(self._memory) + len(self._votes) + len(self._sets) + len(self._increments)
+
+    def pending_score(self, user_id: str) -> int:
+        with self._lock:
+            return self._pending_score(user_id)
+
+    def _pending_score(self, user_id: str) -> int:
+        # Deltas pas encore confirmés par le stockage : en file et en cours d'écriture
+        return sum(scores[user_id][1] for scores in [self._scores] + [b[0] for b in self._inflight]
+                   if user_id in scores)
+
+    def known_score(self, user_id: str):
+        entry = self._known.get(user_id)
+        if entry is None:
+            return None
+        with self._lock:
+            return entry[0] + self._pending_score(user_id)
+
+    def score_token(self, user_id: str):
+        # À prendre avant de lire le score stocké, puis à passer à remember_score()
+        with self._lock:
+            return (self._score_writes.get(user_id, 0),
+                    any(user_id in batch[0] for batch in self._inflight))
+
+    def remember_score(self, user_id: str, stored: int, token):
+        # La valeur lue n'est sûre que si aucune écriture de ce joueur n'était en cours
+        # ni ne s'est terminée pendant la lecture : sinon on ne sait pas si elle contient le lot
+        with self._lock:
+            if token[1] or token != (self._score_writes.get(user_id, 0), False):
+                return None
+            self._known.set(user_id, [stored])
+            return stored + self._pending_score(user_id)
+
+    def pending_memory_best(self, user_id: str):
+        with self._lock:
+            entry = self._memory.get(user_id)
+        return entry[1] if entry else None
+
+    def add_score(self, user_id: str, name: str, delta: int):
+        with self._lock:
+            entry = self._scores.setdefault(user_id, [name, 0])
+            entry[0] = name
+            entry[1] += delta
+        self._submitted()
+
+    def add_memory_best(self, user_id: str, name: str, best_ms: int):
+        with self._lock:
+            entry = self._memory.setdefault(user_id, [name, best_ms])
+            entry[1] = min(entry[1], best_ms)
+        self._submitted()
+
+    def add_vote(self, poll_id: str, user_id: str, option_id: str):
+        with self._lock:
+            self._votes[(poll_id, user_id)] = option_id
+        self._submitted()
+
+    def add_set(self, path: str, value):
+        with self._lock:
+            self._sets[path] = value
+        self._submitted()
+
+    def add_increment(self, path: str, delta: int):
+        with self._lock:
+            self._increments[path] = self._increments.get(path, 0) + delta
+        self._submitted()
+
+    def submit_batch(self, scores=None, memory=None, votes=None, sets=None, increments=None):
+        # Toutes les écritures d'une requête (/batch) : une seule mise à jour multi-chemins
+        # en mode synchrone, fusionnées dans le prochain flush sinon.
+        batch = (scores or {}, memory or {}, votes or {}, sets or {}, increments or {})
+        if self.window <= 0:
+            with self._flush_lock:
+                self._write_tracked(batch)
+            return
+        self._merge(*batch, newer=True)
+        self._submitted()
+
+    def after_fork(self):
+        # Le parent flushera lui-même ce qu'il avait en attente : le worker repart à vide
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._inflight = []
+        self._known.clear()
+        self._score_writes = {}
+        self._reset()
+
+    def on_flush(self, callback):
+        # callback(updates) appelé après chaque écriture groupée réussie
+        self._listeners.append(callback)
+        return callback
+
+    def _submitted(self):
+        if self.window <= 0 or self.pending() >= self.max_pending:
+            self.flush()
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.window)
+            self._wakeup.clear()
+            self.flush()
+
+    def claim_votes(self, votes: dict, increments: dict):
+        # Chaque votant est réservé par une transaction sur poll_voters/<poll>/<user> : la valeur
+        # remplacée donne le -1, même si un autre worker vote pour le même joueur en même temps.
+        # Les ±1 rejoignent les incréments (retentés tels quels si l'écriture groupée échoue).
+        def claim(poll_id, user_id, option_id):
+            replaced = []
+            def take_slot(current):
+                replaced[:] = [current]
+                return option_id
+            store.transaction(f"poll_voters/{poll_id}/{user_id}", take_slot)
+            return replaced[0] if replaced else None
+
+        def safe_claim(key, option_id):
+            try:
+                return True, claim(*key, option_id)
+            except Exception as e:
+                return False, e
+
+        increments, unclaimed = dict(increments), {}
+        votes = list(votes.items())
+        outcomes = gather(*[partial(safe_claim, key, option_id) for key, option_id in votes])
+        for ((poll_id, user_id), option_id), (ok, previous) in zip(votes, outcomes):
+            if not ok:
+                if self.window <= 0:
+                    raise previous
+                unclaimed[(poll_id, user_id)] = option_id
+                continue
+            if previous == option_id:
+                continue
+            path = f"polls/{poll_id}/counts/{option_id}"
+            increments[path] = increments.get(path, 0) + 1
+            if previous:
+                path = f"polls/{poll_id}/counts/{previous}"
+                increments[path] = increments.get(path, 0) - 1
+        return unclaimed, increments
+
+    def build_updates(self, scores: dict, memory: dict, sets: dict, increments: dict) -> dict:
+        updates = {}
+        for user_id, (name, delta) in scores.items():
+            updates[f"leaderboard/{user_id}/name"] = name
+            updates[f"leaderboard/{user_id}/score"] = server_increment(delta)
+        for user_id, (name, best_ms) in memory.items():
+            updates[f"games/memory/{user_id}/name"] = name
+            updates[f"games/memory/{user_id}/best_time_ms"] = best_ms
+        updates.update(sets)
+        for path, delta in increments.items():
+            if delta:
+                updates[path] = server_increment(delta)
+        return updates
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch = (self._scores, self._memory, self._votes, self._sets, self._increments)
+                self._reset()
+            self._write_tracked(batch)
+
+    def _write_tracked(self, batch):
+        with self._lock:
+            self._inflight.append(batch)
+        written = False
+        try:
+            written = self._write(batch)
+        finally:
+            with self._lock:
+                self._inflight = [b for b in self._inflight if b is not batch]
+                for user_id, (_, delta) in batch[0].items():
+                    self._score_writes[user_id] = self._score_writes.get(user_id, 0) + 1
+                    entry = self._known.get(user_id)
+                    if written and entry is not None:
+                        entry[0] += delta
+
+    def _write(self, batch):
+        scores, memory, votes, sets, increments = batch
+        try:
+            votes, increments = self.claim_votes(votes, increments)
+            batch = (scores, memory, votes, sets, increments)
+            updates = self.build_updates(scores, memory, sets, increments)
+        except Exception as e:
+            if self.window <= 0:
+                raise
+            print("⚠️ Échec de la préparation de l'écriture groupée :", e)
+            self._merge(*batch, newer=False)
+            return False
+        if votes:
+            print(f"⚠️ {len(votes)} vote(s) non enregistré(s), nouvel essai au prochain flush")
+            self._merge({}, {}, votes, {}, {}, newer=False)
+        if not updates:
+            return True
+        try:
+            store.update("/", updates)
+        except Exception as e:
+            if self.window <= 0:
+                raise
+            # Les requêtes ont déjà répondu : on garde les écritures pour le prochain flush
+            print("⚠️ Échec de l'écriture groupée, nouvel essai au prochain flush :", e)
+            self._merge(scores, memory, {}, sets, increments, newer=False)
+            return False
+        for callback in self._listeners:
+            # Les données sont déjà écrites : un callback en échec ne doit ni faire échouer
+            # la requête (mode synchrone) ni arrêter le thread d'écriture
+            try:
+                callback(updates)
+            except Exception as e:
+                print(f"⚠️ Échec du callback après écriture ({getattr(callback, '__name__', callback)}) :", e)
+        return True
+
+    def _merge(self, scores, memory, votes, sets, increments, newer: bool):
+        # newer=False : remise en file après un échec, les entrées déjà en attente sont plus récentes
+        with self._lock:
+            for user_id, (name, delta) in scores.items():
+                entry = self._scores.setdefault(user_id, [name, 0])
+                if newer:
+                    entry[0] = name
+                entry[1] += delta
+            for user_id, (name, best_ms) in memory.items():
+                entry = self._memory.setdefault(user_id, [name, best_ms])
+                entry[1] = min(entry[1], best_ms)
+            for key, option_id in votes.items():
+                if newer:
+                    self._votes[key] = option_id
+                else:
+                    self._votes.setdefault(key, option_id)
+            for path, value in sets.items():
+                if newer:
+                    self._sets[path] = value
+                else:
+                    self._sets.setdefault(path, value)
+            for path, delta in increments.items():
+                self._increments[path] = self._increments.get(path, 0) + delta
+
+
+WRITES = WriteBehindQueue(
+    window_ms=int(os.getenv("WRITE_BEHIND_MS", 200)),
+    max_pending=int(os.getenv("WRITE_BEHIND_MAX", 500)),
+)
+atexit.register(WRITES.flush)
+
+
+# ---------- Flux temps réel (SSE) ----------
+# Bus de changements en mémoire : chaque écriture publie un événement par sujet,
+# les clients /stream le reçoivent sans relire Firebase. Les ids d'événements
+# sont préfixés par l'instance pour que Last-Event-ID ne rejoue que nos événements
+# (un id d'une autre instance reçoit "reset"). Les événements des autres workers
+# arrivent par le relais (EventRelay, plus bas).
+STREAM_TOPICS = {"wishes", "leaderboard", "polls", "memory"}
+# Sous gunicorn, chaque flux garde un thread : plafond par défaut = moitié des threads
+# (voir gunicorn.conf.py)
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 200))
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))
+STREAM_HISTORY = int(os.getenv("STREAM_HISTORY", 500))
+
+
+class Subscription:
+    def __init__(self, topics: set):
+        self.topics = topics
+        self.events = queue.Queue(maxsize=1000)
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # Client trop lent : on le déconnecte, il se reconnectera avec Last-Event-ID
+            self.overflowed = True
+
+
+class ChangeBus:
+    def __init__(self, max_subscribers: int, history: int):
+        self.max_subscribers = max_subscribers
+        self.history = history
+        self._forwarders = []
+        self.after_fork()
+
+    def after_fork(self):
+        # Une instance par processus : les ids du parent ne valent rien dans le worker
+        self.instance = new_push_id()[-6:]
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history = deque(maxlen=self.history)
+        self._subscribers = set()
+
+    def on_publish(self, callback):
+        # callback(topic, data) pour chaque événement né dans ce processus
+        self._forwarders.append(callback)
+        return callback
+
+    def publish(self, topic: str, data: dict, origin: str = None):
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, topic, data)
+            self._history.append(event)
+            subscribers = [sub for sub in self._subscribers if topic in sub.topics]
+        for sub in subscribers:
+            sub.deliver(event)
+        if origin is None:
+            for callback in self._forwarders:
+                callback(topic, data)
+
+    def reset_all(self):
+        # Événements perdus (relais interrompu) : tous les clients doivent recharger
+        with self._lock:
+            subscribers = list(self._subscribers)
+            seq = self._seq
+        for sub in subscribers:
+            sub.deliver((seq, "reset", {"type": "reset"}))
+
+    def subscribe(self, topics: set, last_event_id: str = None):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            sub = Subscription(topics)
+            instance, _, seq = (last_event_id or "").partition("-")
+            if last_event_id and (instance != self.instance or not seq.isdigit()):
+                # Id d'un autre worker (ou d'avant un redémarrage) : rien à rejouer ici
+                sub.deliver((self._seq, "reset", {"type": "reset"}))
+            elif last_event_id:
+                seq = int(seq)
+                if self._history and self._history[0][0] > seq + 1:
+                    # Trou dans l'historique : le client doit tout recharger
+                    sub.deliver((self._seq, "reset", {"type": "reset"}))
+                else:
+                    for event in self._history:
+                        if event[0] > seq and event[1] in topics:
+                            sub.deliver(event)
+            self._subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def close(self):
+        # Arrêt du worker : chaque flux se termine, le client se reconnecte ailleurs
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.overflowed = True
+            try:
+                sub.events.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def format(self, event) -> str:
+        seq, topic, data = event
+        return f"id: {self.instance}-{seq}\nevent: {topic}\ndata: {json.dumps(data)}\n\n"
+
+
+CHANGES = ChangeBus(max_subscribers=STREAM_MAX_SUBSCRIBERS, history=STREAM_HISTORY)
+
+
+# Relais entre processus : chaque événement publié ici est aussi écrit, par lots toutes les
+# STREAM_RELAY_MS, sous stream_events/<clé> ; les autres workers le reçoivent par listen()
+# (Firebase) ou par une requête périodique (SQLite) et le diffusent à leurs clients.
+# Les événements de plus de STREAM_RELAY_TTL secondes sont purgés (".indexOn": "at").
+# Au plus STREAM_RELAY_OUTBOX événements en attente d'envoi : au-delà (relais arrêté ou en
+# échec), les plus anciens sont perdus et les autres workers font recharger leurs clients.
+STREAM_RELAY = os.getenv("STREAM_RELAY", "1") == "1"
+STREAM_RELAY_MS = int(os.getenv("STREAM_RELAY_MS", 100))
+STREAM_RELAY_TTL = float(os.getenv("STREAM_RELAY_TTL", 120))
+STREAM_RELAY_OUTBOX = int(os.getenv("STREAM_RELAY_OUTBOX", 1000))
+
+
+class EventRelay(NodeMirror):
+    def __init__(self, bus: ChangeBus, path: str = "stream_events"):
+        super().__init__(path)
+        self.bus = bus
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._reset_pump()
+
+    def _reset_pump(self):
+        self._outbox = []
+        self._outbox_lock = threading.Lock()
+        self._lost = False
+        self._pump_thread = None
+        self._pump_stop = threading.Event()
+        self._polled_at = time.time()
+        self._polled_keys = set()
+        self._pruned_at = 0.0
+        self._was_loaded = False
+
+    def send(self, topic: str, data: dict):
+        with self._outbox_lock:
+            self._outbox.append((new_push_id(), {
+                "origin": self.bus.instance, "topic": topic, "data": data, "at": time.time(),
+            }))
+            self._trim_outbox()
+
+    def _trim_outbox(self):
+        excess = len(self._outbox) - STREAM_RELAY_OUTBOX
+        if excess > 0:
+            del self._outbox[:excess]
+            self.dropped += excess
+            self._lost = True
+
+    def start_pump(self):
+        if self._pump_thread is None or not self._pump_thread.is_alive():
+            self._pump_stop.clear()
+            self._pump_thread = threading.Thread(target=self._run_pump, name="stream-relay", daemon=True)
+            self._pump_thread.start()
+
+    def pumping(self) -> bool:
+        return self._pump_thread is not None and self._pump_thread.is_alive()
+
+    def stop_pump(self):
+        self._pump_stop.set()
+        self.push_outbox()
+        self.stop()
+
+    def after_fork(self):
+        super().after_fork()
+        self._reset_pump()
+
+    def _run_pump(self):
+        while not self._pump_stop.wait(STREAM_RELAY_MS / 1000.0):
+            try:
+                self.pump()
+            except Exception as e:
+                self.errors += 1
+                print("⚠️ Relais des événements :", e)
+
+    def pump(self):
+        self.push_outbox()
+        if store.supports_listen:
+            if not self.healthy():
+                self.start()
+        else:
+            self.poll()
+        if time.time() - self._pruned_at > STREAM_RELAY_TTL / 2:
+            self.prune()
+
+    def push_outbox(self):
+        with self._outbox_lock:
+            outbox, self._outbox = self._outbox, []
+            lost, self._lost = self._lost, False
+        if lost:
+            # Événements perdus : les autres workers font recharger tous leurs clients
+            outbox.append((new_push_id(), {"origin": self.bus.instance, "topic": "reset", "at": time.time()}))
+        if not outbox:
+            return
+        try:
+            store.update("/", {f"{self.path}/{key}": event for key, event in outbox})
+        except Exception:
+            with self._outbox_lock:
+                self._outbox[:0] = outbox
+                self._trim_outbox()
+            raise
+        self.sent += len(outbox)
+
+    def poll(self):
+        rows = store.query(self.path, "at", start_at=self._polled_at, limit_to_first=1000)
+        for key, event in rows.items():
+            if key not in self._polled_keys:
+                self.deliver(event)
+        if rows:
+            self._polled_at = max((e or {}).get("at", 0) for e in rows.values())
+            self._polled_keys = {k for k, e in rows.items() if (e or {}).get("at") == self._polled_at}
+
+    def prune(self):
+        self._pruned_at = time.time()
+        old = store.query(self.path, "at", end_at=self._pruned_at - STREAM_RELAY_TTL, limit_to_first=500)
+        if old:
+            store.update("/", {f"{self.path}/{key}": None for key in old})
+
+    def deliver(self, event):
+        if not isinstance(event, dict) or event.get("origin") == self.bus.instance:
+            return
+        if event.get("topic") == "reset":
+            self.bus.reset_all()
+        elif event.get("topic") in STREAM_TOPICS:
+            self.received += 1
+            self.bus.publish(event["topic"], event.get("data") or {}, origin=event.get("origin"))
+
+    def _on_event(self, event):
+        super()._on_event(event)
+        parts = [p for p in (event.path or "/").split("/") if p]
+        if event.event_type == "patch":
+            for sub, value in (event.data or {}).items():
+                if len(parts + [p for p in sub.split("/") if p]) == 1:
+                    self.deliver(value)
+        elif not parts:
+            # Chargement initial : l'historique est déjà passé ; après une reconnexion,
+            # des événements ont pu être manqués entre-temps
+            if self._was_loaded:
+                self.bus.reset_all()
+            self._was_loaded = True
+        elif len(parts) == 1:
+            self.deliver(event.data)
+
+    def stats(self) -> dict:
+        return dict(super().stats(), sent=self.sent, received=self.received, dropped=self.dropped, instance=self.bus.instance)
+
+
+RELAY = EventRelay(CHANGES)
+if STREAM_RELAY:
+    CHANGES.on_publish(RELAY.send)
+
+@WRITES.on_flush
+def publish_flushed_writes(updates: dict):
+    poll_deltas = {}
+    for path, value in updates.items():
+        parts = path.split("/")
+        if parts[0] == "leaderboard" and parts[-1] == "score":
+            user_id = parts[1]
+            CHANGES.publish("leaderboard", {
+                "type": "score",
+                "user_id": user_id,
+                "name": updates.get(f"leaderboard/{user_id}/name"),
+                "delta": value[".sv"]["increment"],
+                "score": cached_score(user_id),
+            })
+        elif parts[:2] == ["games", "memory"] and parts[-1] == "best_time_ms":
+            CHANGES.publish("memory", {"type": "best", "user_id": parts[2], "best_time_ms": value})
+        elif parts[0] == "polls" and parts[2] == "counts":
+            poll_deltas.setdefault(parts[1], {})[parts[3]] = value[".sv"]["increment"]
+    for poll_id, deltas in poll_deltas.items():
+        CHANGES.publish("polls", {"type": "votes", "poll_id": poll_id, "count_deltas": deltas})
+
+
+# ---------- Wishes ----------
+def add_wish(name: str, message: str):
+    wish = {
+        "name": name,
+        "message": message,
+        "hearts": 0,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    wish_id = store.push("wishes", wish)
+    CHANGES.publish("wishes", {"type": "wish", "wish": dict(wish, id=wish_id)})
+    return wish_id
+
+
+def list_wishes(limit: int, before: str = None):
+    items, next_cursor = page_by_created_at("wishes", limit, cursor=before)
+    for item in items:
+        item["hearts"] = count_hearts(item)
+        item.pop("heart_shards", None)
+    return items, next_cursor
+
+
+# ---------- Coeurs ----------
+# HEART_SHARDS > 1 répartit les clics sur N compteurs wishes/<id>/heart_shards/sN
+# (somme à la lecture) pour qu'un voeu très populaire ne sérialise pas tous les écrivains.
+# Chaque clic est un incrément côté serveur, jamais une transaction.
+HEART_SHARDS = int(os.getenv("HEART_SHARDS", 1))
+HEART_TOTALS = TTLCache(maxsize=1024, ttl=float(os.getenv("HEART_TOTAL_TTL", 2)))
+
+def count_hearts(wish: dict) -> int:
+    shards = wish.get("heart_shards") or {}
+    return int(wish.get("hearts") or 0) + sum(int(v or 0) for v in shards.values())
+
+def heart_counter_path(wish_id: str) -> str:
+    if HEART_SHARDS <= 1:
+        return f"wishes/{wish_id}/hearts"
+    return f"wishes/{wish_id}/heart_shards/s{random.randrange(HEART_SHARDS)}"
+
+def heart_total(wish_id: str) -> int:
+    total = HEART_TOTALS.get(wish_id) if HEART_SHARDS > 1 else None
+    if total is None:
+        total = count_hearts(store.get(f"wishes/{wish_id}") or {})
+    return total
+
+def add_heart(wish_id: str) -> int:
+    # Incrément côté serveur (pas de transaction : ni aller-retour lecture/écriture
+    # conditionnelle, ni abandon quand les clics se bousculent), puis relecture du total
+    store.update("/", {heart_counter_path(wish_id): server_increment(1)})
+    if HEART_SHARDS <= 1:
+        return int(store.get(f"wishes/{wish_id}/hearts") or 0)
+    total = HEART_TOTALS.get(wish_id)
+    if total is None:
+        total = count_hearts(store.get(f"wishes/{wish_id}") or {})
+    else:
+        total += 1
+    HEART_TOTALS.set(wish_id, total)
+    return total
 
 @app.route("/wishes", methods=["GET", "POST", "OPTIONS"])
+@http_cached("wishes", "wishes")
 def wishes():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
     if request.method == "GET":
-        return jsonify({"wishes": list_wishes()})
+        limit = parse_limit(request.args.get("limit"), default=50, maximum=200)
+        items, next_cursor = list_wishes(limit, request.args.get("before"))
+        return jsonify({"wishes": items, "next_cursor": next_cursor})
     
     data = request.get_json() or {}
     name = sanitize_text(data.get("name"), 40)
@@ -147,10 +1566,11 @@ def wish_heart():
     wish_id = (data.get("id") or "").strip()
     if not wish_id:
         return jsonify({"error": "id required"}), 400
-    ref = db.reference(f"wishes/{wish_id}/hearts")
-    current = ref.get() or 0
-    ref.set(int(current) + 1)
-    return jsonify({"ok": True, "hearts": int(current) + 1})
+    if not is_safe_key(wish_id):
+        return jsonify({"error": "invalid id"}), 400
+    hearts = add_heart(wish_id)
+    CHANGES.publish("wishes", {"type": "heart", "id": wish_id, "hearts": hearts})
+    return jsonify({"ok": True, "hearts": hearts})
 
 
 # ---------- Leaderboard ----------
@@ -162,6 +1582,28 @@ def get_or_create_user_by_name(name: str):
     return uid, u
 
 
+def get_or_create_user_id(name: str):
+    return get_user_id_by_name(name) or create_user(name)
+
+
+def cached_score(user_id: str):
+    # Score stocké connu par la file + deltas en attente, sans lecture
+    return WRITES.known_score(user_id)
+
+def current_score(user_id: str) -> int:
+    score = WRITES.known_score(user_id)
+    if score is not None:
+        return score
+    # Pas d'attente du flusher : si une écriture de ce joueur est en cours pendant la
+    # lecture, on relit une fois puis on se contente de valeur lue + deltas en attente
+    for _ in range(2):
+        token = WRITES.score_token(user_id)
+        stored = int(store.get(f"leaderboard/{user_id}/score") or 0)
+        score = WRITES.remember_score(user_id, stored, token)
+        if score is not None:
+            return score
+    return stored + WRITES.pending_score(user_id)
+
 @app.route("/leaderboard/score", methods=["POST", "OPTIONS"])
 def lb_score():
     if request.method == "OPTIONS":
@@ -172,45 +1614,86 @@ def lb_score():
     if not name or delta == 0:
         return jsonify({"error": "name and non-zero delta required"}), 400
     user_id, user = get_or_create_user_by_name(name)
-    lref = db.reference(f"leaderboard/{user_id}")
-    entry = lref.get() or {"name": user.get("name", name), "score": 0}
-    entry["score"] = int(entry.get("score", 0)) + delta
-    lref.set(entry)
-    return jsonify({"ok": True, "entry": {"user_id": user_id, **entry}})
+    display_name = user.get("name", name)
+    score = current_score(user_id) + delta
+    WRITES.add_score(user_id, display_name, delta)
+    return jsonify({"ok": True, "entry": {"user_id": user_id, "name": display_name, "score": score}})
 
 
 @app.route("/leaderboard/top", methods=["GET", "OPTIONS"])
+@http_cached("leaderboard", "leaderboard")
 def lb_top():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
-    data = db.reference("leaderboard").get() or {}
+    limit = parse_limit(request.args.get("limit"), default=10, maximum=100)
+    # Requête limitée côté serveur (".indexOn": "score" sur leaderboard) : O(limit)
+    data = store.query("leaderboard", "score", limit_to_last=limit)
     items = []
     for uid, v in data.items():
         v = v or {}
         v["user_id"] = uid
         items.append(v)
-    items.sort(key=lambda x: int(x.get("score", 0)), reverse=True)
-    return jsonify({"top": items[:10]})
+    items.reverse()
+    return jsonify({"top": items})
 
 
 # ---------- Polls ----------
+# polls/<poll_id> : question, libellés des options et compteurs "counts" ;
+# poll_voters/<poll_id>/<user_id> : option choisie, réservée par transaction au flush
+# (voir WriteBehindQueue.claim_votes) ; seules les options du sondage sont acceptées.
+POLL_RESULTS = TTLCache(maxsize=256, ttl=float(os.getenv("POLL_CACHE_TTL", 5)))
+
+@WRITES.on_flush
+def invalidate_poll_results(updates: dict):
+    for path in updates:
+        if path.startswith("polls/"):
+            POLL_RESULTS.pop(path.split("/")[1])
+
+def migrate_legacy_votes(poll_id: str, poll: dict):
+    # Anciennes données : votes stockés sous options/<opt>/votes/<user_id>
+    voters = {}
+    for option_id, option in (poll.get("options") or {}).items():
+        for user_id in ((option or {}).get("votes") or {}):
+            voters[user_id] = option_id
+    counts = {option_id: 0 for option_id in (poll.get("options") or {})}
+    for option_id in voters.values():
+        counts[option_id] += 1
+    updates = {f"polls/{poll_id}/counts": counts}
+    for option_id in poll.get("options") or {}:
+        updates[f"polls/{poll_id}/options/{option_id}/votes"] = None
+    for user_id, option_id in voters.items():
+        updates[f"poll_voters/{poll_id}/{user_id}"] = option_id
+    store.update("/", updates)
+    for option in (poll.get("options") or {}).values():
+        (option or {}).pop("votes", None)
+    poll["counts"] = counts
+    return poll
+
+def load_poll(poll_id: str) -> dict:
+    poll = POLL_RESULTS.get(poll_id)
+    if poll is None:
+        poll = read_node(f"polls/{poll_id}") or {}
+        # init default poll if empty
+        if not poll or not poll.get("options"):
+            default_q = "Quel gateau pour Junior ?"
+            default_opts = {"opt1": {"label": "Choco"}, "opt2": {"label": "Vanille"}, "opt3": {"label": "Fraise"}}
+            poll = {"question": default_q, "options": default_opts, "counts": {k: 0 for k in default_opts}}
+            store.set(f"polls/{poll_id}", poll)
+        elif any("votes" in (v or {}) for v in poll["options"].values()):
+            poll = migrate_legacy_votes(poll_id, poll)
+        counts = poll.get("counts") or {}
+        poll["counts"] = {k: int(counts.get(k) or 0) for k in poll["options"]}
+        POLL_RESULTS.set(poll_id, poll)
+    return poll
+
 @app.route("/polls/<poll_id>", methods=["GET", "POST", "OPTIONS"])
 def polls(poll_id):
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
-    pref = db.reference(f"polls/{poll_id}")
+    if not is_safe_key(poll_id):
+        return jsonify({"error": "invalid poll_id"}), 400
     if request.method == "GET":
-        poll = pref.get() or {}
-        # init default poll if empty
-        if not poll or not poll.get("options"):
-            default_q = "Quel gateau pour Junior ?"
-            default_opts = {"opt1": {"label": "Choco"}, "opt2": {"label": "Vanille"}, "opt3": {"label": "Fraise"}}
-            pref.set({"question": default_q, "options": default_opts})
-            poll = pref.get() or {}
-        opts = (poll.get("options") or {})
-        counts = {k: len((v.get("votes") or {})) for k, v in opts.items()}
-        poll["counts"] = counts
-        return jsonify({"poll": poll})
+        return jsonify({"poll": load_poll(poll_id)})
     
     data = request.get_json() or {}
     action = (data.get("action") or "").strip()
@@ -221,107 +1704,419 @@ def polls(poll_id):
         for idx, label in enumerate(options):
             lid = f"opt{idx+1}"
             opts[lid] = {"label": sanitize_text(str(label), 60)}
-        pref.set({"question": question, "options": opts})
+        store.update("/", {
+            f"polls/{poll_id}": {"question": question, "options": opts, "counts": {k: 0 for k in opts}},
+            f"poll_voters/{poll_id}": None,
+        })
+        POLL_RESULTS.pop(poll_id)
         return jsonify({"ok": True})
     elif action == "vote":
         name = sanitize_text(data.get("name"), 40)
         option_id = (data.get("option_id") or "").strip()
         if not name or not option_id:
             return jsonify({"error": "name and option_id required"}), 400
-        user_id, _ = get_or_create_user_by_name(name)
-        vref = db.reference(f"polls/{poll_id}/options/{option_id}/votes/{user_id}")
-        vref.set(True)
+        if option_id not in load_poll(poll_id)["options"]:
+            return jsonify({"error": "unknown option"}), 400
+        user_id = get_or_create_user_id(name)
+        WRITES.add_vote(poll_id, user_id, option_id)
         return jsonify({"ok": True})
     return jsonify({"error": "invalid action"}), 400
 
 
 # ---------- Memory game ----------
+# games/memory/<user_id> : {name, best_time_ms} ; games/memory/_global_best : record
+# absolu {best_time_ms, user_id, name}, mis à jour après chaque écriture groupée.
+MEMORY_GLOBAL_KEY = "_global_best"
+MEMORY_BOARD_MAX = 50
+MEMORY_GLOBAL_FALLBACK = TTLCache(maxsize=1, ttl=30)
+# Record absolu gardé quelques secondes : vidé ici à chaque amélioration, les autres
+# workers le voient au plus tard après MEMORY_GLOBAL_TTL
+MEMORY_GLOBAL = TTLCache(maxsize=1, ttl=float(os.getenv("MEMORY_GLOBAL_TTL", 2)))
+
+@WRITES.on_flush
+def update_memory_global_best(updates: dict):
+    candidate = None
+    for path, value in updates.items():
+        parts = path.split("/")
+        if parts[:2] == ["games", "memory"] and parts[-1] == "best_time_ms":
+            if candidate is None or value < candidate["best_time_ms"]:
+                user_id = parts[2]
+                candidate = {
+                    "best_time_ms": value,
+                    "user_id": user_id,
+                    "name": updates.get(f"games/memory/{user_id}/name"),
+                }
+    if candidate is None:
+        return
+    improved = []
+
+    def keep_best(current):
+        improved.clear()
+        if not isinstance(current, dict):
+            # Premier record agrégé : on part du meilleur temps déjà enregistré
+            current = scan_memory_best()
+        if isinstance(current, dict) and isinstance(current.get("best_time_ms"), int) \
+                and current["best_time_ms"] <= candidate["best_time_ms"]:
+            return current
+        improved.append(True)
+        return candidate
+
+    store.transaction(f"games/memory/{MEMORY_GLOBAL_KEY}", keep_best)
+    if improved:
+        MEMORY_GLOBAL_FALLBACK.clear()
+        MEMORY_GLOBAL.clear()
+        CHANGES.publish("memory", dict(candidate, type="global_best"))
+
+def scan_memory_best():
+    best = None
+    for uid, val in (store.get("games/memory") or {}).items():
+        if uid == MEMORY_GLOBAL_KEY or not isinstance(val, dict):
+            continue
+        b = val.get("best_time_ms")
+        if isinstance(b, int) and (best is None or b < best["best_time_ms"]):
+            best = {"best_time_ms": b, "user_id": uid, "name": val.get("name")}
+    return best
+
+def memory_global_best():
+    cached = MEMORY_GLOBAL.get("best")
+    if cached is not None:
+        return cached[0]
+    record = store.get(f"games/memory/{MEMORY_GLOBAL_KEY}")
+    if isinstance(record, dict):
+        MEMORY_GLOBAL.set("best", (record.get("best_time_ms"),))
+        return record.get("best_time_ms")
+    # Données antérieures à l'agrégat : parcours complet, gardé en cache, sans écriture
+    cached = MEMORY_GLOBAL_FALLBACK.get("best")
+    if cached is None:
+        cached = ((scan_memory_best() or {}).get("best_time_ms"),)
+        MEMORY_GLOBAL_FALLBACK.set("best", cached)
+    return cached[0]
+
+def previous_memory_best(user_id: str):
+    prev = WRITES.pending_memory_best(user_id)
+    if prev is None:
+        prev = store.get(f"games/memory/{user_id}/best_time_ms")
+    return prev
+
+def memory_board(limit: int):
+    rows = store.query("games/memory", "best_time_ms", limit_to_first=limit + 1)
+    board = []
+    for uid, val in rows.items():
+        if uid == MEMORY_GLOBAL_KEY or not isinstance(val, dict) or not isinstance(val.get("best_time_ms"), int):
+            continue
+        board.append({"user_id": uid, "name": val.get("name"), "best_time_ms": val["best_time_ms"]})
+    return board[:limit]
+
 @app.route("/games/memory/best", methods=["GET", "POST", "OPTIONS"])
 def memory_best():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
     if request.method == "GET":
+        # Lecture seule : l'id est résolu par l'index sans rien écrire (noms inconnus
+        # mis en cache, voir get_user_id_by_name). Temps du joueur, record absolu et
+        # classement sont lus en parallèle : deux allers-retours au plus (index puis
+        # temps du joueur), une seule lecture quand l'id et le record sont en cache.
         name = sanitize_text(request.args.get("name", ""), 40)
-        user_best = None
-        if name:
-            uid, _ = get_or_create_user_by_name(name)
-            uref = db.reference(f"games/memory/{uid}")
-            u = uref.get() or {}
-            ub = u.get("best_time_ms")
-            if isinstance(ub, int):
-                user_best = ub
-        all_ref = db.reference("games/memory").get() or {}
-        global_best = None
-        for _uid, val in (all_ref or {}).items():
-            if not isinstance(val, dict):
-                continue
-            b = val.get("best_time_ms")
-            if isinstance(b, int):
-                global_best = b if global_best is None else min(global_best, b)
-        return jsonify({"ok": True, "user_best_ms": user_best, "global_best_ms": global_best})
+        top = request.args.get("top")
+
+        def user_best():
+            uid = get_user_id_by_name(name) if name else None
+            if not uid:
+                return None
+            ub = WRITES.pending_memory_best(uid)
+            if ub is None:
+                ub = store.get(f"games/memory/{uid}/best_time_ms")
+            return ub if isinstance(ub, int) else None
+
+        calls = [user_best, memory_global_best]
+        if top:
+            calls.append(partial(memory_board, parse_limit(top, default=10, maximum=MEMORY_BOARD_MAX)))
+        results = gather(*calls)
+        result = {"ok": True, "user_best_ms": results[0], "global_best_ms": results[1]}
+        if top:
+            result["top"] = results[2]
+        return jsonify(result)
     data = request.get_json() or {}
     name = sanitize_text(data.get("name"), 40)
     best_ms = int(data.get("best_time_ms", 0))
     if not name or best_ms <= 0:
         return jsonify({"error": "name and best_time_ms required"}), 400
-    user_id, _ = get_or_create_user_by_name(name)
-    ref = db.reference(f"games/memory/{user_id}")
-    cur = ref.get() or {}
-    prev = cur.get("best_time_ms")
+    user_id = get_or_create_user_id(name)
+    prev = previous_memory_best(user_id)
     if not isinstance(prev, int) or best_ms < prev:
-        ref.set({"best_time_ms": best_ms})
+        WRITES.add_memory_best(user_id, name, best_ms)
         prev = best_ms
     return jsonify({"ok": True, "best_time_ms": prev})
 
 # ---------- NOUVEAU: Galerie Photo ----------
+# Les images ne sont plus stockées dans "gallery" : la liste ne contient que des
+# métadonnées, les octets vivent sous gallery_images/<id>/{full,thumb}.
+# Une photo reste dans gallery_uploads/<id> (non listé) tant qu'elle n'est pas traitée ;
+# elle n'entre dans "gallery" qu'une fois ses images écrites.
+GALLERY_MAX_UPLOAD_BYTES = int(os.getenv("GALLERY_MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+GALLERY_FULL_SIDE = int(os.getenv("GALLERY_FULL_SIDE", 1600))
+GALLERY_THUMB_SIDE = int(os.getenv("GALLERY_THUMB_SIDE", 320))
+GALLERY_VARIANTS = {"image": "full", "thumb": "thumb"}
+IMAGE_CACHE = TTLCache(maxsize=int(os.getenv("IMAGE_CACHE_SIZE", 128)), ttl=3600)
+GALLERY_MAX_PIXELS = int(os.getenv("GALLERY_MAX_PIXELS", 40_000_000))
+# Une data URL base64 pèse ~4/3 de l'image : borne globale des corps de requête
+app.config["MAX_CONTENT_LENGTH"] = GALLERY_MAX_UPLOAD_BYTES * 4 // 3 + 64 * 1024
+
+# Traitement des images hors du worker HTTP : pool borné + file d'attente bornée.
+# GALLERY_WORKERS=0 traite l'image dans la requête (tests).
+GALLERY_WORKERS = int(os.getenv("GALLERY_WORKERS", 2))
+GALLERY_QUEUE_SIZE = int(os.getenv("GALLERY_QUEUE_SIZE", 16))
+GALLERY_TMP_DIR = os.getenv("GALLERY_TMP_DIR") or tempfile.gettempdir()
+UPLOAD_CHUNK = 64 * 1024
+IMAGE_POOL = ThreadPoolExecutor(max_workers=GALLERY_WORKERS, thread_name_prefix="gallery") if GALLERY_WORKERS > 0 else None
+IMAGE_SLOTS = threading.BoundedSemaphore(GALLERY_QUEUE_SIZE)
+
+def decode_data_url(image_data: str):
+    header, _, payload = (image_data or "").partition(",")
+    if not header.startswith("data:image/") or not header.endswith(";base64"):
+        raise ValueError("invalid image format")
+    try:
+        return base64.b64decode(payload, validate=True)
+    except ValueError:
+        raise ValueError("invalid image encoding")
+
+def pil():
+    # Pillow n'est importé qu'au premier traitement d'image (ou au préchauffage)
+    import PIL.Image, PIL.ImageOps, PIL.features
+    PIL.Image.MAX_IMAGE_PIXELS = GALLERY_MAX_PIXELS
+    return PIL
+
+def encode_image(img, max_side: int, fmt: str, quality: int):
+    img = img.copy()
+    img.thumbnail((max_side, max_side), pil().Image.LANCZOS)
+    out = BytesIO()
+    img.save(out, format=fmt, quality=quality, optimize=True)
+    return out.getvalue()
+
+def process_image(raw: bytes):
+    # Décodage et validation avec PIL, puis ré-encodage (ce qui supprime les EXIF)
+    PIL = pil()
+    try:
+        with PIL.Image.open(BytesIO(raw)) as probe:
+            probe.verify()
+        img = PIL.Image.open(BytesIO(raw))
+        img = PIL.ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+    except (PIL.UnidentifiedImageError, PIL.Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError("invalid image")
+    thumb_format = "WEBP" if PIL.features.check("webp") else "JPEG"
+    return {
+        "width": img.width,
+        "height": img.height,
+        "full": {"mime": "image/jpeg", "data": encode_image(img, GALLERY_FULL_SIDE, "JPEG", 85)},
+        "thumb": {
+            "mime": f"image/{thumb_format.lower()}",
+            "data": encode_image(img, GALLERY_THUMB_SIDE, thumb_format, 75),
+        },
+    }
+
+def store_photo(photo_id: str, record: dict, processed: dict):
+    # Fiche publique, images et fin de l'envoi écrits en une seule mise à jour multi-chemins
+    updates = {
+        f"gallery/{photo_id}": {
+            **record,
+            "width": processed["width"],
+            "height": processed["height"],
+            "status": "ready",
+        },
+        f"gallery_uploads/{photo_id}": None,
+    }
+    for variant in ("full", "thumb"):
+        blob = processed[variant]
+        updates[f"gallery_images/{photo_id}/{variant}"] = {
+            "mime": blob["mime"],
+            "data": base64.b64encode(blob["data"]).decode("ascii"),
+        }
+    store.update("/", updates)
+
+def spool_upload(stream, first_chunk: bytes = b""):
+    # Copie par morceaux dans un fichier temporaire, sans dépasser la taille maximale
+    size = len(first_chunk)
+    if size > GALLERY_MAX_UPLOAD_BYTES:
+        raise OverflowError("image too large")
+    tmp = tempfile.NamedTemporaryFile(dir=GALLERY_TMP_DIR, suffix=".upload", delete=False)
+    try:
+        with tmp:
+            tmp.write(first_chunk)
+            while stream is not None:
+                chunk = stream.read(UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > GALLERY_MAX_UPLOAD_BYTES:
+                    raise OverflowError("image too large")
+                tmp.write(chunk)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    if size == 0:
+        os.unlink(tmp.name)
+        raise ValueError("image data required")
+    return tmp.name
+
+def process_upload(photo_id: str, path: str, record: dict):
+    # Renvoie None si la photo est publiée, sinon le message d'erreur montré à l'envoyeur
+    try:
+        with open(path, "rb") as f:
+            processed = process_image(f.read())
+        store_photo(photo_id, record, processed)
+        return None
+    except Exception as e:
+        print(f"⚠️ Photo {photo_id} refusée :", e)
+        error = "invalid image" if isinstance(e, ValueError) else "processing failed"
+        store.set(f"gallery_uploads/{photo_id}", {**record, "status": "error", "error": error})
+        return error
+    finally:
+        os.unlink(path)
+
+def read_upload():
+    # JSON (data URL), multipart/form-data (champ "image") ou corps binaire brut
+    if request.is_json:
+        data = request.get_json() or {}
+        if not data.get("image"):
+            raise ValueError("image data required")
+        return spool_upload(None, decode_data_url(data["image"])), data
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("image")
+        if upload is None:
+            raise ValueError("image data required")
+        return spool_upload(upload.stream), request.form
+    return spool_upload(request.stream), request.args
+
+def photo_listing_item(photo: dict):
+    photo.pop("image_data", None)
+    photo["thumb_url"] = url_for("gallery_image", photo_id=photo["id"], variant="thumb", _external=True)
+    photo["image_url"] = url_for("gallery_image", photo_id=photo["id"], variant="image", _external=True)
+    return photo
+
+def load_photo_blob(photo_id: str, variant: str):
+    cache_key = (photo_id, variant)
+    blob = IMAGE_CACHE.get(cache_key)
+    if blob is not None:
+        return blob
+    stored = store.get(f"gallery_images/{photo_id}/{variant}")
+    if stored:
+        blob = (stored.get("mime") or "image/jpeg", base64.b64decode(stored.get("data") or ""))
+    else:
+        # Anciennes photos : data URL complète stockée dans la fiche
+        legacy = store.get(f"gallery/{photo_id}/image_data")
+        if not legacy:
+            return None
+        try:
+            raw = decode_data_url(legacy)
+        except ValueError:
+            return None
+        blob = (legacy[5:legacy.index(";")], raw)
+    IMAGE_CACHE.set(cache_key, blob)
+    return blob
+
 @app.route("/gallery", methods=["GET", "POST", "OPTIONS"])
+@http_cached("gallery", "gallery")
 def gallery():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
     
     if request.method == "GET":
-        # Retourner les photos de la galerie
-        ref = db.reference("gallery")
-        photos_data = ref.get() or {}
-        photos = []
-        for pid, photo in photos_data.items():
-            photo = photo or {}
-            photo["id"] = pid
-            photos.append(photo)
-        photos.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        return jsonify({"photos": photos})
+        # Retourner les photos de la galerie, page par page (métadonnées + URLs)
+        limit = parse_limit(request.args.get("limit"), default=20, maximum=50)
+        photos, next_cursor = page_by_created_at("gallery", limit, cursor=request.args.get("before"))
+        photos = [photo_listing_item(p) for p in photos if p.get("status", "ready") == "ready"]
+        return jsonify({"photos": photos, "next_cursor": next_cursor})
     
-    # POST - Upload d'une nouvelle photo
+    # POST - Upload d'une nouvelle photo, traitée en arrière-plan
     try:
-        data = request.get_json() or {}
-        image_data = data.get("image")  # base64
-        caption = sanitize_text(data.get("caption", "Photo partagée"), 100)
-        name = sanitize_text(data.get("name", "Invité"), 40)
-        
-        if not image_data:
-            return jsonify({"error": "image data required"}), 400
-        
-        # Validation basique de l'image
-        if not image_data.startswith('data:image/'):
-            return jsonify({"error": "invalid image format"}), 400
-        
-        # Stocker dans Firebase
-        ref = db.reference("gallery")
-        new_photo = ref.push({
-            "caption": caption,
-            "uploaded_by": name,
-            "created_at": datetime.utcnow().isoformat(),
-            "image_data": image_data  # En production, stocker dans Cloud Storage
-        })
-        
-        return jsonify({"ok": True, "photo_id": new_photo.key})
+        if request.content_length and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+            return jsonify({"error": "image too large"}), 413
+        if not IMAGE_SLOTS.acquire(blocking=False):
+            return jsonify({"error": "too many uploads in progress, retry later"}), 503
+        # Le créneau et le fichier temporaire sont libérés ici quelle que soit l'erreur,
+        # sauf une fois confiés au traitement (qui s'en charge)
+        path, handed_off = None, False
+        try:
+            path, fields = read_upload()
+            caption = sanitize_text(fields.get("caption", "Photo partagée"), 100)
+            name = sanitize_text(fields.get("name", "Invité"), 40)
+            photo_id = new_push_id()
+            record = {
+                "caption": caption,
+                "uploaded_by": name,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+            
+            if IMAGE_POOL is None:
+                handed_off = True
+                try:
+                    error = process_upload(photo_id, path, record)
+                finally:
+                    IMAGE_SLOTS.release()
+                if error:
+                    store.delete(f"gallery_uploads/{photo_id}")
+                    return jsonify({"error": error}), 400 if error == "invalid image" else 500
+                return jsonify({"ok": True, "photo_id": photo_id, "status": "ready"})
+            
+            store.set(f"gallery_uploads/{photo_id}", {**record, "status": "processing"})
+            job = IMAGE_POOL.submit(process_upload, photo_id, path, record)
+            handed_off = True
+            job.add_done_callback(lambda _job: IMAGE_SLOTS.release())
+            return jsonify({"ok": True, "photo_id": photo_id, "status": "processing"}), 202
+        except OverflowError as e:
+            return jsonify({"error": str(e)}), 413
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        finally:
+            if not handed_off:
+                IMAGE_SLOTS.release()
+                if path is not None and os.path.exists(path):
+                    os.unlink(path)
         
+    except HTTPException as e:
+        # JSON mal formé, corps trop gros... : le code HTTP de werkzeug, pas un 500
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/gallery/<photo_id>", methods=["GET"])
+def gallery_photo(photo_id):
+    # Photo publiée, sinon état de l'envoi (processing / error) sans URLs d'images
+    photo = read_node(f"gallery/{photo_id}")
+    if photo and photo.get("status", "ready") == "ready":
+        photo["id"] = photo_id
+        return jsonify({"photo": photo_listing_item(photo)})
+    upload = store.get(f"gallery_uploads/{photo_id}")
+    if not upload:
+        return jsonify({"error": "not found"}), 404
+    upload["id"] = photo_id
+    return jsonify({"photo": upload})
+
+
+@app.route("/gallery/<photo_id>/<variant>", methods=["GET"])
+def gallery_image(photo_id, variant):
+    if variant not in GALLERY_VARIANTS:
+        return jsonify({"error": "not found"}), 404
+    # Une photo n'est jamais modifiée : l'ETag se déduit de l'id, sans lecture Firebase
+    etag = f"{photo_id}.{variant}"
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        blob = load_photo_blob(photo_id, GALLERY_VARIANTS[variant])
+        if blob is None:
+            return jsonify({"error": "not found"}), 404
+        mime, raw = blob
+        response = app.response_class(raw, mimetype=mime)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 # ---------- NOUVEAU: Compte à rebours ----------
 @app.route("/countdown", methods=["GET", "OPTIONS"])
+@http_cached("countdown")
 def get_countdown():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
@@ -347,6 +2142,118 @@ def get_countdown():
 
 
 # ---------- Chat principal ----------
+# Anecdotes et quiz construits une fois par célébré (LRU). Les commandes sans état
+# passent par une table et répondent sans aucun appel au stockage. L'état du quiz
+# (step, score) est gardé en mémoire par utilisateur ; chaque tour l'écrit par une
+# transaction sur users/<id> qui vérifie l'étape attendue. Si un autre worker a fait
+# avancer le quiz entre-temps, la session est rechargée et la réponse corrigée sur
+# la bonne question (jamais de retour en arrière ni de point compté deux fois).
+SESSIONS = TTLCache(
+    maxsize=int(os.getenv("SESSION_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", 120)),
+)
+WELCOME_IMAGE = "https://cdn-icons-png.flaticon.com/512/744/744502.png"
+CANDLES_IMAGE = "https://cdn-icons-png.flaticon.com/512/4151/4151051.png"
+ALREADY_PLAYED = "Tu as déjà joué. Tape 'rejouer', 'anecdote' ou 'galerie'."
+HELP_REPLIES = (
+    "Commandes disponibles :",
+    "- 'anecdote' : une anecdote sur le célébré",
+    "- 'bougies'  : souffler les bougies",
+    "- 'musique'  : chanson d'anniversaire",
+    "- 'carte'    : petit message",
+    "- 'rejouer'  : recommencer le quiz",
+    "- 'galerie'  : voir les photos",
+    "- 'compte'   : voir le compte à rebours",
+)
+
+@lru_cache(maxsize=64)
+def celebrant_content(celebrant: str):
+    return tuple(build_anecdotes(celebrant)), tuple(build_quiz(celebrant))
+
+def countdown_reply():
+    diff = datetime(2024, 12, 25) - datetime.utcnow()
+    if diff.days > 0:
+        return f"Prochain anniversaire dans {diff.days} jours ! 🎉"
+    return "🎉 C'est l'anniversaire aujourd'hui ! 🎉"
+
+# Commandes sans état : (célébré, anecdotes) -> (réponses, filter_image)
+CHAT_COMMANDS = {
+    "aide": lambda celebrant, anecdotes: (list(HELP_REPLIES), None),
+    "help": lambda celebrant, anecdotes: (list(HELP_REPLIES), None),
+    "?": lambda celebrant, anecdotes: (list(HELP_REPLIES), None),
+    "anecdote": lambda celebrant, anecdotes: (["Anecdote : " + random.choice(anecdotes)], None),
+    "bougies": lambda celebrant, anecdotes: (["Soufflons les bougies ! Fais un vœu."], CANDLES_IMAGE),
+    "musique": lambda celebrant, anecdotes: (["Chanson d'anniversaire : https://www.youtube.com/watch?v=90bG0HzV5MU"], None),
+    "carte": lambda celebrant, anecdotes: ([f"Carte pour {celebrant} : Que cette année t'apporte succès, joie et code sans bugs !"], None),
+    "galerie": lambda celebrant, anecdotes: (["📸 Va dans la section 'Galerie Photo' pour voir et partager des photos !"], None),
+    "compte": lambda celebrant, anecdotes: ([countdown_reply()], None),
+}
+
+# Étape du quiz -> (question à corriger, étape suivante, bonne réponse, mauvaise réponse)
+QUIZ_STEPS = {
+    "quiz_q1": (0, "quiz_q2", "Bonne réponse !", "Pas tout à fait..."),
+    "quiz_q2": (1, "quiz_q3", "Bravo !", "Tu ne connais pas si bien {celebrant}."),
+    "quiz_q3": (2, "done", "Excellent ! 🎉", "Presque !"),
+}
+
+def load_session(name: str):
+    user_id = get_user_id_by_name(name)
+    if user_id is None:
+        return None, None
+    session = SESSIONS.get(user_id)
+    if session is None or session["step"] not in QUIZ_STEPS:
+        # Étape hors quiz (terminé) : un 'rejouer' a pu passer par un autre worker,
+        # quiz_turn ne peut pas le voir, on relit donc la fiche stockée
+        user = store.get(f"users/{user_id}")
+        if user is None:
+            return None, None
+        session = {"name": user.get("name", name), "step": user.get("step", "quiz_q1"), "score": user.get("score", 0)}
+        SESSIONS.set(user_id, session)
+    return user_id, session
+
+def save_session(user_id: str, session: dict, **changes):
+    update_user(user_id, changes)
+    session.update(changes)
+    SESSIONS.set(user_id, session)
+
+def advance_quiz(user_id: str, step: str, next_step: str, gained: int):
+    # Écriture conditionnelle : seulement si l'étape stockée est celle qu'on vient de corriger.
+    # Renvoie (appliqué, fiche utilisateur après la transaction).
+    applied = []
+    def advance(current):
+        applied.clear()
+        if not isinstance(current, dict) or current.get("step", "quiz_q1") != step:
+            return current
+        applied.append(True)
+        return dict(current, step=next_step, score=int(current.get("score") or 0) + gained)
+    user = store.transaction(f"users/{user_id}", advance)
+    return bool(applied), user if isinstance(user, dict) else {}
+
+def quiz_turn(user_id: str, session: dict, answer: str, quiz, celebrant: str):
+    applied = False
+    for _ in range(2):
+        if session["step"] not in QUIZ_STEPS:
+            break
+        index, next_step, right, wrong = QUIZ_STEPS[session["step"]]
+        correct = answer == quiz[index]["answer"]
+        applied, user = advance_quiz(user_id, session["step"], next_step, int(correct))
+        session.update(step=user.get("step", "quiz_q1"), score=int(user.get("score") or 0))
+        SESSIONS.set(user_id, session)
+        if applied:
+            break
+    if not applied:
+        # Quiz terminé ou avancé ailleurs entre-temps : on repart de l'état stocké
+        if session["step"] in QUIZ_STEPS:
+            return [quiz[QUIZ_STEPS[session["step"]][0]]["question"]]
+        return [ALREADY_PLAYED]
+    replies = [right if correct else wrong.format(celebrant=celebrant)]
+    if next_step == "done":
+        replies.append(f"Merci d'avoir joué {session['name']} ! Score : {session['score']}/{len(quiz)}")
+        replies.append("Tape 'rejouer' pour recommencer ou 'aide' pour les commandes.")
+    else:
+        replies.append(quiz[index + 1]["question"])
+    return replies
+
 @app.route("/message", methods=["POST", "OPTIONS"])
 def message():
     if request.method == "OPTIONS":
@@ -356,25 +2263,14 @@ def message():
     text = (data.get("text") or "").strip()
     provided_name = (data.get("name") or "").strip()
     celebrant = (data.get("celebrant") or DEFAULT_CELEBRANT).strip() or DEFAULT_CELEBRANT
-    ANECDOTES = build_anecdotes(celebrant)
-    QUIZ = build_quiz(celebrant)
-
-    replies = []
-    filter_image = None
-
+    anecdotes, quiz = celebrant_content(celebrant)
     tl = text.lower()
 
     # Commandes globales
-    if tl in {"aide", "help", "?"}:
-        replies.append("Commandes disponibles :")
-        replies.append("- 'anecdote' : une anecdote sur le célébré")
-        replies.append("- 'bougies'  : souffler les bougies")
-        replies.append("- 'musique'  : chanson d'anniversaire")
-        replies.append("- 'carte'    : petit message")
-        replies.append("- 'rejouer'  : recommencer le quiz")
-        replies.append("- 'galerie'  : voir les photos")
-        replies.append("- 'compte'   : voir le compte à rebours")
-        return jsonify({"replies": replies, "filter_image": None})
+    command = CHAT_COMMANDS.get(tl)
+    if command is not None:
+        replies, filter_image = command(celebrant, anecdotes)
+        return jsonify({"replies": replies, "filter_image": filter_image})
 
     # Prénom utilisateur
     if provided_name:
@@ -384,92 +2280,48 @@ def message():
     name = name.capitalize() if name else ""
 
     if not name:
-        replies.append("Dis-moi ton prénom pour commencer.")
-        return jsonify({"replies": replies, "filter_image": None})
+        return jsonify({"replies": ["Dis-moi ton prénom pour commencer."], "filter_image": None})
 
-    user_id, user = get_user_by_name(name)
+    user_id, session = load_session(name)
 
-    if user is None:
+    if session is None:
         # Nouvel utilisateur
         user_id = create_user(name)
-        replies.append(f"Bienvenue {name} !")
-        replies.append(f"Joyeux anniversaire à {celebrant} !")
-        replies.append("Voici une anecdote : " + random.choice(ANECDOTES))
-        replies.append(QUIZ[0]["question"])
-        filter_image = "https://cdn-icons-png.flaticon.com/512/744/744502.png"
+        SESSIONS.set(user_id, {"name": name, "step": "quiz_q1", "score": 0})
+        return jsonify({
+            "replies": [
+                f"Bienvenue {name} !",
+                f"Joyeux anniversaire à {celebrant} !",
+                "Voici une anecdote : " + random.choice(anecdotes),
+                quiz[0]["question"],
+            ],
+            "filter_image": WELCOME_IMAGE,
+        })
+
+    if tl == "rejouer":
+        save_session(user_id, session, step="quiz_q1", score=0)
+        replies = ["C'est reparti !", quiz[0]["question"]]
+    elif session["step"] in QUIZ_STEPS:
+        # Le quiz a pu avancer sur un autre worker : quiz_turn recharge l'étape si besoin
+        replies = quiz_turn(user_id, session, tl, quiz, celebrant)
     else:
-        step = user.get("step", "quiz_q1")
-        score = user.get("score", 0)
-
-        # Commandes utilisateur
-        if tl == "rejouer":
-            update_user(user_id, {"step": "quiz_q1", "score": 0})
-            replies.append("C'est reparti !")
-            replies.append(QUIZ[0]["question"])
-        elif tl == "anecdote":
-            replies.append("Anecdote : " + random.choice(ANECDOTES))
-        elif tl == "bougies":
-            replies.append("Soufflons les bougies ! Fais un vœu.")
-            filter_image = "https://cdn-icons-png.flaticon.com/512/4151/4151051.png"
-        elif tl == "musique":
-            replies.append("Chanson d'anniversaire : https://www.youtube.com/watch?v=90bG0HzV5MU")
-        elif tl == "carte":
-            replies.append(f"Carte pour {celebrant} : Que cette année t'apporte succès, joie et code sans bugs !")
-        elif tl == "galerie":
-            replies.append("📸 Va dans la section 'Galerie Photo' pour voir et partager des photos !")
-        elif tl == "compte":
-            next_bd = datetime(2024, 12, 25)
-            now = datetime.utcnow()
-            diff = next_bd - now
-            if diff.days > 0:
-                replies.append(f"Prochain anniversaire dans {diff.days} jours ! 🎉")
-            else:
-                replies.append("🎉 C'est l'anniversaire aujourd'hui ! 🎉")
-        elif step == "quiz_q1":
-            if text.lower() == QUIZ[0]["answer"]:
-                score += 1
-                replies.append("Bonne réponse !")
-            else:
-                replies.append("Pas tout à fait...")
-            update_user(user_id, {"step": "quiz_q2", "score": score})
-            replies.append(QUIZ[1]["question"])
-        elif step == "quiz_q2":
-            if text.lower() == QUIZ[1]["answer"]:
-                score += 1
-                replies.append("Bravo !")
-            else:
-                replies.append(f"Tu ne connais pas si bien {celebrant}.")
-            update_user(user_id, {"step": "quiz_q3", "score": score})
-            replies.append(QUIZ[2]["question"])
-        elif step == "quiz_q3":
-            if text.lower() == QUIZ[2]["answer"]:
-                score += 1
-                replies.append("Excellent ! 🎉")
-            else:
-                replies.append("Presque !")
-            update_user(user_id, {"step": "done", "score": score})
-            replies.append(f"Merci d'avoir joué {user['name']} ! Score : {score}/{len(QUIZ)}")
-            replies.append("Tape 'rejouer' pour recommencer ou 'aide' pour les commandes.")
-        else:
-            replies.append("Tu as déjà joué. Tape 'rejouer', 'anecdote' ou 'galerie'.")
+        replies = [ALREADY_PLAYED]
 
-    return jsonify({"replies": replies, "filter_image": filter_image})
+    return jsonify({"replies": replies, "filter_image": None})
 # ---------- NOUVEAU: Système de Quiz ----------
 @app.route("/quiz/questions", methods=["GET", "POST", "OPTIONS"])
+@http_cached("quiz_questions", "quiz/questions")
 def quiz_questions():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
     
-    ref = db.reference("quiz/questions")
-    
     if request.method == "GET":
-        questions_data = ref.get() or {}
-        questions = []
-        for qid, question in questions_data.items():
-            question = question or {}
-            question["id"] = qid
-            questions.append(question)
-        return jsonify({"questions": questions})
+        # Ordre chronologique conservé : on pagine vers l'avant avec ?after=
+        limit = parse_limit(request.args.get("limit"), default=50, maximum=200)
+        questions, next_cursor = page_by_created_at(
+            "quiz/questions", limit, cursor=request.args.get("after"), newest_first=False
+        )
+        return jsonify({"questions": questions, "next_cursor": next_cursor})
     
     # POST - Ajouter une nouvelle question
     data = request.get_json() or {}
@@ -487,18 +2339,107 @@ def quiz_questions():
         "created_at": datetime.utcnow().isoformat()
     }
     
-    new_ref = ref.push(new_question)
-    return jsonify({"ok": True, "question_id": new_ref.key})
+    question_id = store.push("quiz/questions", new_question)
+    return jsonify({"ok": True, "question_id": question_id})
 
 @app.route("/quiz/questions/<question_id>", methods=["DELETE", "OPTIONS"])
 def delete_quiz_question(question_id):
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
-    
-    ref = db.reference(f"quiz/questions/{question_id}")
-    ref.delete()
+    if not is_safe_key(question_id):
+        return jsonify({"error": "invalid question_id"}), 400
+    store.delete(f"quiz/questions/{question_id}")
     return jsonify({"ok": True})
 
+# ---------- Scores du quiz ----------
+# quiz/scores : chaque tentative (compactée régulièrement) ; quiz/best/<nom normalisé> :
+# meilleure tentative par joueur, lue avec une requête limitée (".indexOn": "percentage").
+QUIZ_COMPACT_BATCH = 500
+
+def merge_quiz_best(key: str, attempt: dict):
+    def keep_best(current):
+        if isinstance(current, dict) and current.get("percentage", 0) >= attempt.get("percentage", 0):
+            return current
+        return {k: attempt.get(k) for k in ("name", "score", "total", "percentage", "created_at")}
+    store.transaction(f"quiz/best/{key}", keep_best)
+
+def best_attempts_by_player(attempts):
+    best = {}
+    for attempt in attempts:
+        key = name_key(attempt.get("name") or "")
+        if key and (key not in best or attempt.get("percentage", 0) > best[key].get("percentage", 0)):
+            best[key] = attempt
+    return best
+
+@WRITES.on_flush
+def update_quiz_best(updates: dict):
+    attempts = [v for path, v in updates.items() if path.startswith("quiz/scores/") and isinstance(v, dict)]
+    for key, attempt in best_attempts_by_player(attempts).items():
+        merge_quiz_best(key, attempt)
+
+@migration("quiz_best")
+def backfill_quiz_best():
+    # Tentatives antérieures à l'index : toutes repliées dans quiz/best, sans rien archiver
+    attempts = [a for a in (store.get("quiz/scores") or {}).values() if isinstance(a, dict)]
+    best = best_attempts_by_player(attempts)
+    for key, attempt in best.items():
+        merge_quiz_best(key, attempt)
+    return {"attempts": len(attempts), "players": len(best)}
+
+def compact_quiz_scores(keep_days: int = 7, prune: bool = False):
+    # Replie les tentatives plus anciennes que keep_days dans quiz/best et quiz/stats,
+    # puis les déplace vers quiz/archive (ou les supprime avec prune=True).
+    cutoff = (datetime.utcnow() - timedelta(days=keep_days)).isoformat()
+    summary = {"compacted": 0, "archived": 0, "pruned": 0}
+    while True:
+        rows = store.query("quiz/scores", "created_at", end_at=cutoff, limit_to_first=QUIZ_COMPACT_BATCH)
+        if not rows:
+            break
+        for key, attempt in best_attempts_by_player(rows.values()).items():
+            merge_quiz_best(key, attempt)
+        updates = {
+            "quiz/stats/attempts": server_increment(len(rows)),
+            "quiz/stats/percentage_sum": server_increment(sum(r.get("percentage", 0) for r in rows.values())),
+        }
+        for sid, attempt in rows.items():
+            updates[f"quiz/scores/{sid}"] = None
+            if not prune:
+                updates[f"quiz/archive/{sid}"] = attempt
+        store.update("/", updates)
+        summary["compacted"] += len(rows)
+        summary["pruned" if prune else "archived"] += len(rows)
+        if len(rows) < QUIZ_COMPACT_BATCH:
+            break
+    return summary
+
+@app.cli.command("compact-quiz")
+@click.option("--keep-days", default=7, show_default=True, help="Tentatives récentes conservées telles quelles.")
+@click.option("--prune", is_flag=True, help="Supprimer au lieu d'archiver.")
+def compact_quiz_command(keep_days, prune):
+    WRITES.flush()
+    click.echo(json.dumps(compact_quiz_scores(keep_days, prune)))
+
+@app.route("/admin/quiz/compact", methods=["POST", "OPTIONS"])
+def compact_quiz_endpoint():
+    if request.method == "OPTIONS":
+        return jsonify({"ok": True})
+    token = os.getenv("ADMIN_TOKEN")
+    if not token or not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        return jsonify({"error": "forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    WRITES.flush()
+    summary = compact_quiz_scores(int(data.get("keep_days", 7)), bool(data.get("prune", False)))
+    return jsonify({"ok": True, **summary})
+
+def quiz_attempt(name: str, score: int, total: int) -> dict:
+    return {
+        "name": name,
+        "score": score,
+        "total": total,
+        "percentage": (score / total * 100) if total > 0 else 0,
+        "created_at": datetime.utcnow().isoformat()
+    }
+
 @app.route("/quiz/score", methods=["POST", "OPTIONS"])
 def save_quiz_score():
     if request.method == "OPTIONS":
@@ -512,24 +2453,30 @@ def save_quiz_score():
     if not name:
         return jsonify({"error": "Name required"}), 400
     
-    ref = db.reference("quiz/scores")
-    new_score = ref.push({
-        "name": name,
-        "score": score,
-        "total": total,
-        "percentage": (score / total * 100) if total > 0 else 0,
-        "created_at": datetime.utcnow().isoformat()
-    })
+    score_id = new_push_id()
+    WRITES.add_set(f"quiz/scores/{score_id}", quiz_attempt(name, score, total))
     
-    return jsonify({"ok": True, "score_id": new_score.key})
+    return jsonify({"ok": True, "score_id": score_id})
 
 @app.route("/quiz/leaderboard", methods=["GET", "OPTIONS"])
+@http_cached("quiz_leaderboard", "quiz/best", "quiz/scores")
 def quiz_leaderboard():
     if request.method == "OPTIONS":
         return jsonify({"ok": True})
     
-    ref = db.reference("quiz/scores")
-    scores_data = ref.get() or {}
+    # Index complet une fois la migration quiz_best faite (voir run_migrations)
+    if migration_done("quiz_best"):
+        best = store.query("quiz/best", "percentage", limit_to_last=10)
+        scores = []
+        for key, score in best.items():
+            score = score or {}
+            score["id"] = key
+            scores.append(score)
+        scores.reverse()
+        return jsonify({"leaderboard": scores})
+    
+    # Index pas encore construit : ancien parcours complet
+    scores_data = store.get("quiz/scores") or {}
     scores = []
     
     for sid, score in scores_data.items():
@@ -542,13 +2489,362 @@ def quiz_leaderboard():
     return jsonify({"leaderboard": scores[:10]})
 
 
+# ---------- Batch ----------
+# POST /batch {"name": "Alice", "ops": [
+#     {"op": "score", "delta": 5}, {"op": "memory_best", "best_time_ms": 31000},
+#     {"op": "quiz_score", "score": 4, "total": 5}, {"op": "vote", "poll_id": "p1", "option_id": "opt2"},
+#     {"op": "heart", "id": "<wish_id>"}]}
+# Un seul appel HTTP par écran : l'utilisateur est résolu une fois, les lectures
+# partent en parallèle et toutes les écritures en une mise à jour multi-chemins.
+# Réponse : un résultat par opération, dans l'ordre (même forme que la route d'origine).
+BATCH_MAX_OPS = int(os.getenv("BATCH_MAX_OPS", 20))
+BATCH_USER_OPS = {"score", "memory_best", "vote"}
+
+def parse_batch_op(op, name: str) -> dict:
+    if not isinstance(op, dict):
+        raise ValueError("invalid op")
+    kind = op.get("op")
+    if kind in BATCH_USER_OPS or kind == "quiz_score":
+        if not name:
+            raise ValueError("name required")
+    if kind == "score":
+        delta = int(op.get("delta", 0))
+        if delta == 0:
+            raise ValueError("non-zero delta required")
+        return {"op": kind, "delta": delta}
+    if kind == "memory_best":
+        best_ms = int(op.get("best_time_ms", 0))
+        if best_ms <= 0:
+            raise ValueError("best_time_ms required")
+        return {"op": kind, "best_time_ms": best_ms}
+    if kind == "quiz_score":
+        return {"op": kind, "score": int(op.get("score", 0)), "total": int(op.get("total", 0))}
+    if kind == "vote":
+        poll_id = (op.get("poll_id") or "").strip()
+        option_id = (op.get("option_id") or "").strip()
+        if not poll_id or not option_id:
+            raise ValueError("poll_id and option_id required")
+        if not is_safe_key(poll_id) or not is_safe_key(option_id):
+            raise ValueError("invalid poll_id or option_id")
+        return {"op": kind, "poll_id": poll_id, "option_id": option_id}
+    if kind == "heart":
+        wish_id = (op.get("id") or "").strip()
+        if not wish_id:
+            raise ValueError("id required")
+        if not is_safe_key(wish_id):
+            raise ValueError("invalid id")
+        return {"op": kind, "id": wish_id}
+    raise ValueError(f"unknown op: {kind}")
+
+
+@app.route("/batch", methods=["POST", "OPTIONS"])
+def batch():
+    if request.method == "OPTIONS":
+        return jsonify({"ok": True})
+    data = request.get_json() or {}
+    ops = data.get("ops")
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "ops required"}), 400
+    if len(ops) > BATCH_MAX_OPS:
+        return jsonify({"error": f"at most {BATCH_MAX_OPS} ops"}), 400
+    name = sanitize_text(data.get("name"), 40)
+
+    results, valid = [None] * len(ops), []
+    for index, op in enumerate(ops):
+        try:
+            valid.append((index, parse_batch_op(op, name)))
+        except (ValueError, TypeError) as e:
+            results[index] = {"ok": False, "error": str(e)}
+    kinds = {op["op"] for _, op in valid}
+
+    user_id, display_name = None, name
+    if kinds & BATCH_USER_OPS:
+        user_id, user = get_or_create_user_by_name(name)
+        display_name = user.get("name", name)
+
+    # Lectures indépendantes en parallèle : score, meilleur temps, coeurs de chaque voeu
+    reads = {}
+    if "score" in kinds:
+        reads["score"] = partial(current_score, user_id)
+    if "memory_best" in kinds:
+        reads["memory_best"] = partial(previous_memory_best, user_id)
+    for _, op in valid:
+        if op["op"] == "heart":
+            reads[("heart", op["id"])] = partial(heart_total, op["id"])
+        elif op["op"] == "vote":
+            reads[("poll", op["poll_id"])] = partial(load_poll, op["poll_id"])
+    state = dict(zip(reads, gather(*reads.values())))
+
+    scores, memory, votes, sets, increments = {}, {}, {}, {}, {}
+    for index, op in valid:
+        kind = op["op"]
+        if kind == "score":
+            state["score"] += op["delta"]
+            scores.setdefault(user_id, [display_name, 0])[1] += op["delta"]
+            results[index] = {"ok": True, "entry": {"user_id": user_id, "name": display_name, "score": state["score"]}}
+        elif kind == "memory_best":
+            prev = state["memory_best"]
+            if not isinstance(prev, int) or op["best_time_ms"] < prev:
+                memory[user_id] = [name, op["best_time_ms"]]
+                prev = state["memory_best"] = op["best_time_ms"]
+            results[index] = {"ok": True, "best_time_ms": prev}
+        elif kind == "quiz_score":
+            score_id = new_push_id()
+            sets[f"quiz/scores/{score_id}"] = quiz_attempt(name, op["score"], op["total"])
+            results[index] = {"ok": True, "score_id": score_id}
+        elif kind == "vote":
+            if op["option_id"] not in state[("poll", op["poll_id"])]["options"]:
+                results[index] = {"ok": False, "error": "unknown option"}
+                continue
+            votes[(op["poll_id"], user_id)] = op["option_id"]
+            results[index] = {"ok": True}
+        elif kind == "heart":
+            path = heart_counter_path(op["id"])
+            increments[path] = increments.get(path, 0) + 1
+            state[("heart", op["id"])] += 1
+            results[index] = {"ok": True, "hearts": state[("heart", op["id"])]}
+
+    WRITES.submit_batch(scores, memory, votes, sets, increments)
+    for key, hearts in state.items():
+        if isinstance(key, tuple) and key[0] == "heart":
+            if HEART_SHARDS > 1:
+                HEART_TOTALS.set(key[1], hearts)
+            CHANGES.publish("wishes", {"type": "heart", "id": key[1], "hearts": hearts})
+    return jsonify({"ok": all(r["ok"] for r in results), "results": results})
+
+
+# ---------- Flux temps réel ----------
+@app.route("/stream", methods=["GET"])
+def stream():
+    requested = request.args.get("topics")
+    topics = set(requested.split(",")) & STREAM_TOPICS if requested else set(STREAM_TOPICS)
+    if not topics:
+        return jsonify({"error": "unknown topics", "topics": sorted(STREAM_TOPICS)}), 400
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if SHUTTING_DOWN.is_set():
+        return jsonify({"error": "shutting down"}), 503
+    sub = CHANGES.subscribe(topics, last_event_id)
+    if sub is None:
+        return jsonify({"error": "too many subscribers"}), 503
+
+    def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not sub.overflowed:
+                try:
+                    event = sub.events.get(timeout=STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                yield CHANGES.format(event)
+        finally:
+            CHANGES.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- Statistiques internes ----------
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({
+        "mirrors": {path: m.stats() for path, m in MIRRORS.items()},
+        "stream": dict(RELAY.stats(), subscribers=CHANGES.subscriber_count()),
+        "json": "orjson" if orjson is not None else "json",
+        "compression": ENCODINGS,
+        "responses": RESPONSE_STATS.snapshot(),
+    })
+
+
+def runtime_families():
+    responses = RESPONSE_STATS.snapshot()
+    return [
+        ("write_behind_pending", "gauge", "Écritures en attente du prochain flush", [((), WRITES.pending())]),
+        ("stream_subscribers", "gauge", "Clients /stream connectés", [((), CHANGES.subscriber_count())]),
+        ("mirror_healthy", "gauge", "Miroir local chargé et à l'écoute",
+         [((("node", path),), int(mirror.healthy())) for path, mirror in MIRRORS.items()]),
+        ("http_response_bytes_total", "counter", "Octets de réponse avant (raw) et après (sent) compression",
+         [((("route", route), ("stage", stage)), totals.get(f"bytes_{stage}", 0))
+          for route, totals in responses.items() for stage in ("raw", "sent")]),
+        ("http_response_cpu_seconds_total", "counter", "CPU de sérialisation JSON et de compression",
+         [((("route", route), ("stage", stage)), totals.get(f"{stage}_cpu_s", 0))
+          for route, totals in responses.items() for stage in ("serialize", "compress")]),
+    ]
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return jsonify({"error": "unauthorized"}), 401
+    return Response(METRICS.render(runtime_families()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Route de santé
 @app.route("/health", methods=["GET"])
 def health():
     return jsonify({"status": "healthy", "timestamp": datetime.utcnow().isoformat()})
 
 
+# ---------- Cycle de vie (production) ----------
+# gunicorn -c gunicorn.conf.py "app:create_app()" : voir gunicorn.conf.py pour les
+# workers/threads. Les threads (miroirs, write-behind) ne survivent pas à un fork :
+# after_fork() remet l'état du processus à zéro quand l'application est préchargée.
+SHUTTING_DOWN = threading.Event()
+_shutdown_done = False
+
+WARMUP_DONE = threading.Event()
+_warmup_lock = threading.Lock()
+_warmup_started = False
+# Posé par gunicorn.conf.py quand l'application est préchargée : create_app() tourne alors
+# dans le processus maître, le préchauffage n'est lancé que dans les workers (after_fork)
+WARM_UP_IN_WORKERS = os.getenv("WARM_UP_IN_WORKERS", "0") == "1"
+# Une phase en échec est relancée en tâche de fond (attente doublée à chaque essai, au plus
+# WARM_UP_RETRY_MAX secondes) ; /ready reste en 503 tant qu'une phase requise manque.
+WARM_UP_RETRY_MAX = float(os.getenv("WARM_UP_RETRY_MAX", 30))
+WARM_UP_REQUIRED = {"storage_connect", "migrations", "stream_relay"}
+WARMED_UP = set()
+
+def warm_up_phases():
+    phases = OrderedDict([
+        ("storage_connect", store.connect),
+        ("migrations", run_migrations),
+        ("pillow_import", pil),
+        ("mirrors", lambda: [mirror_for(path) for path in MIRRORS]),
+    ])
+    if STREAM_RELAY:
+        phases["stream_relay"] = RELAY.start_pump
+    return phases
+
+def run_warm_up_phases(phases) -> OrderedDict:
+    # Chaque phase est tentée même si une précédente a échoué ; renvoie celles en échec
+    failed = OrderedDict()
+    for phase, fn in phases.items():
+        try:
+            STARTUP.timed(phase, fn)
+        except Exception as e:
+            print(f"⚠️ Préchauffage : phase {phase} en échec :", e)
+            failed[phase] = fn
+        else:
+            STARTUP.errors.pop(phase, None)
+            WARMED_UP.add(phase)
+    return failed
+
+def warm_up():
+    # Ouvre la connexion au stockage, importe Pillow et lance les miroirs avant le
+    # premier vrai visiteur ; /health répond pendant ce temps, /ready attend la fin.
+    try:
+        pending = run_warm_up_phases(warm_up_phases())
+    finally:
+        STARTUP.phases["total"] = round((time.perf_counter() - STARTUP.started) * 1000, 1)
+        WARMUP_DONE.set()
+        print(f"⏱️ Démarrage ({os.getpid()}) : {STARTUP.summary()}")
+    attempts = 0
+    while pending and not SHUTTING_DOWN.wait(min(WARM_UP_RETRY_MAX, 0.5 * 2 ** attempts)):
+        attempts += 1
+        pending = run_warm_up_phases(pending)
+        if not pending:
+            print(f"✅ Préchauffage terminé après {attempts} nouvel(s) essai(s)")
+
+def warm_up_missing() -> list:
+    missing = [phase for phase in warm_up_phases() if phase in WARM_UP_REQUIRED and phase not in WARMED_UP]
+    if STREAM_RELAY and "stream_relay" in WARMED_UP and not RELAY.pumping():
+        missing.append("stream_relay")
+    return missing
+
+def start_warm_up():
+    global _warmup_started
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+def create_app():
+    if not WARM_UP_IN_WORKERS:
+        start_warm_up()
+    return app
+
+def after_fork():
+    global _warmup_lock, _warmup_started, FANOUT_POOL
+    FANOUT_POOL = new_fanout_pool()
+    store.after_fork()
+    WRITES.after_fork()
+    CHANGES.after_fork()
+    RELAY.after_fork()
+    for mirror in MIRRORS.values():
+        mirror.after_fork()
+    _warmup_lock, _warmup_started = threading.Lock(), False
+    WARMUP_DONE.clear()
+    WARMED_UP.clear()
+    start_warm_up()
+
+def stop_streams():
+    # Début de l'arrêt (SIGTERM) : /ready et /stream en 503, flux ouverts terminés
+    SHUTTING_DOWN.set()
+    CHANGES.close()
+
+def shutdown():
+    # Arrêt propre : plus de trafic (/ready en 503), écritures en attente et images en cours terminées
+    global _shutdown_done
+    if _shutdown_done:
+        return
+    _shutdown_done = True
+    stop_streams()
+    if IMAGE_POOL is not None:
+        IMAGE_POOL.shutdown(wait=True)
+    try:
+        WRITES.flush()
+    except Exception as e:
+        print("⚠️ Écritures en attente perdues à l'arrêt :", e)
+    if FANOUT_POOL is not None:
+        FANOUT_POOL.shutdown(wait=False)
+    for mirror in MIRRORS.values():
+        mirror.stop()
+    if STREAM_RELAY:
+        try:
+            RELAY.stop_pump()
+        except Exception as e:
+            print("⚠️ Événements non relayés à l'arrêt :", e)
+    store.close()
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    if SHUTTING_DOWN.is_set():
+        return jsonify({"ready": False, "reason": "shutting down"}), 503
+    if not WARMUP_DONE.is_set():
+        start_warm_up()
+        return jsonify({"ready": False, "reason": "warming up", "startup": STARTUP.phases}), 503
+    missing = warm_up_missing()
+    if missing:
+        return jsonify({
+            "ready": False,
+            "reason": "warm-up incomplete",
+            "pending": missing,
+            "startup_errors": STARTUP.errors,
+        }), 503
+    try:
+        store.ping()
+    except Exception as e:
+        return jsonify({"ready": False, "reason": str(e), "startup": STARTUP.phases}), 503
+    return jsonify({
+        "ready": True,
+        "storage": store.name,
+        "pending_writes": WRITES.pending(),
+        "startup": STARTUP.phases,
+        "startup_errors": STARTUP.errors,
+    })
+
+
+STARTUP.mark("routes")
+
 if __name__ == "__main__":
-    debug_flag = os.getenv("FLASK_DEBUG", "1") == "1"
+    # Serveur de développement uniquement ; en production, gunicorn (Procfile)
+    debug_flag = os.getenv("FLASK_DEBUG", "0") == "1"
     port = int(os.getenv("PORT", 5000))
-    app.run(debug=debug_flag, host="0.0.0.0", port=port)
\ No newline at end of file
+    create_app().run(debug=debug_flag, host="0.0.0.0", port=port)
\ No newline at end of file
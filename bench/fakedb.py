@@ -0,0 +1,282 @@
+# ---------------------------------------------------------------------
+# 🧪 Bouchon local de firebase_admin.db (benchmarks)
+# ---------------------------------------------------------------------
+# Même API que db.reference() pour ce qu'utilise storage.FirebaseStorage :
+# get/set/update/push/delete/transaction/listen et requêtes order_by_child.
+# Les données vivent en mémoire ; chaque appel attend une latence configurable
+# (FAKEDB_LATENCY_MS ± FAKEDB_JITTER_MS) pour imiter l'aller-retour réseau.
+# Une transaction fait comme le SDK : lecture avec ETag puis écriture conditionnelle
+# (set_if_unchanged), relancée sur conflit : au moins deux allers-retours comptés.
+# Activé par FIREBASE_DB_MODULE=bench.fakedb.
+import copy, os, random, threading, time
+from collections import Counter, OrderedDict
+
+from storage import new_push_id, split_path, is_increment
+
+LATENCY_MS = float(os.getenv("FAKEDB_LATENCY_MS", 0))
+JITTER_MS = float(os.getenv("FAKEDB_JITTER_MS", 0))
+CALLS = Counter()
+TRANSACTION_MAX_RETRIES = 25
+
+_root = {}
+_lock = threading.RLock()
+_listeners = []
+
+
+def configure(latency_ms: float = None, jitter_ms: float = None):
+    global LATENCY_MS, JITTER_MS
+    if latency_ms is not None:
+        LATENCY_MS = latency_ms
+    if jitter_ms is not None:
+        JITTER_MS = jitter_ms
+
+
+def reset(data: dict = None):
+    with _lock:
+        _root.clear()
+        _root.update(copy.deepcopy(data or {}))
+    CALLS.clear()
+
+
+def peek(path: str = ""):
+    # Lecture sans latence ni comptage (préparation et vérification des scénarios)
+    with _lock:
+        return copy.deepcopy(_read(split_path(path)))
+
+
+class TransactionAbortedError(Exception):
+    pass
+
+
+def _etag(value) -> str:
+    return str(hash(repr(value)))
+
+
+def _call(op: str):
+    CALLS[op] += 1
+    if LATENCY_MS or JITTER_MS:
+        time.sleep(max(0.0, random.uniform(LATENCY_MS - JITTER_MS, LATENCY_MS + JITTER_MS)) / 1000)
+
+
+def _read(parts):
+    node = _root
+    for part in parts:
+        if isinstance(node, list) and part.isdigit() and int(part) < len(node):
+            node = node[int(part)]
+        elif isinstance(node, dict) and part in node:
+            node = node[part]
+        else:
+            return None
+    return node
+
+
+def _resolve(value, current):
+    # Valeurs serveur ({".sv": {"increment": n}}) résolues à n'importe quelle profondeur
+    if is_increment(value):
+        base = current if isinstance(current, (int, float)) and not isinstance(current, bool) else 0
+        return base + value[".sv"]["increment"]
+    if isinstance(value, dict):
+        current = current if isinstance(current, dict) else {}
+        return {k: _resolve(v, current.get(k)) for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+def _write(parts, value):
+    value = _resolve(value, _read(parts))
+    if not parts:
+        _root.clear()
+        if isinstance(value, dict):
+            _root.update(value)
+        return
+    parents, node = [], _root
+    for part in parts[:-1]:
+        child = node.get(part)
+        if isinstance(child, list):
+            child = node[part] = {str(i): v for i, v in enumerate(child)}
+        elif not isinstance(child, dict):
+            if value is None:
+                return
+            child = node[part] = {}
+        parents.append((node, part))
+        node = child
+    if value is None or value == {}:
+        node.pop(parts[-1], None)
+        # Comme Firebase : un noeud vidé disparaît
+        for parent, part in reversed(parents):
+            if parent[part] == {}:
+                del parent[part]
+    else:
+        node[parts[-1]] = value
+
+
+def _notify(parts):
+    # Événements "put" pour les écoutes situées sous ou au-dessus du chemin écrit
+    for listen_parts, callback in list(_listeners):
+        if parts[:len(listen_parts)] == listen_parts:
+            rel = parts[len(listen_parts):]
+            callback(Event("put", "/" + "/".join(rel), peek("/".join(parts))))
+        elif listen_parts[:len(parts)] == parts:
+            callback(Event("put", "/", peek("/".join(listen_parts))))
+
+
+class Event:
+    def __init__(self, event_type, path, data):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+
+
+class ListenerRegistration:
+    def __init__(self, item):
+        self._item = item
+
+    def close(self):
+        with _lock:
+            if self._item in _listeners:
+                _listeners.remove(self._item)
+
+
+def _sort_key(value):
+    # Ordre Firebase : null < false < true < nombres < chaînes < objets
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, int(value))
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, 0)
+
+
+class Query:
+    def __init__(self, ref, order_by: str):
+        self._ref = ref
+        self._order_by = order_by
+        self._start = self._end = self._equal = None
+        self._first = self._last = None
+
+    def start_at(self, value):
+        self._start = value
+        return self
+
+    def end_at(self, value):
+        self._end = value
+        return self
+
+    def equal_to(self, value):
+        self._equal = value
+        return self
+
+    def limit_to_first(self, n: int):
+        self._first = n
+        return self
+
+    def limit_to_last(self, n: int):
+        self._last = n
+        return self
+
+    def get(self):
+        _call("query")
+        with _lock:
+            data = copy.deepcopy(_read(self._ref._parts))
+        if isinstance(data, list):
+            data = {str(i): v for i, v in enumerate(data)}
+        if not isinstance(data, dict):
+            return OrderedDict()
+        child = lambda v: v.get(self._order_by) if isinstance(v, dict) else None
+        items = sorted(data.items(), key=lambda kv: (_sort_key(child(kv[1])), kv[0]))
+        if self._equal is not None:
+            items = [kv for kv in items if _sort_key(child(kv[1])) == _sort_key(self._equal)]
+        if self._start is not None:
+            items = [kv for kv in items if _sort_key(child(kv[1])) >= _sort_key(self._start)]
+        if self._end is not None:
+            items = [kv for kv in items if _sort_key(child(kv[1])) <= _sort_key(self._end)]
+        if self._first is not None:
+            items = items[:self._first]
+        if self._last is not None:
+            items = items[-self._last:] if self._last else []
+        return OrderedDict(items)
+
+
+class Reference:
+    def __init__(self, path: str = "/"):
+        self._parts = split_path(path)
+        self.path = "/" + "/".join(self._parts)
+
+    @property
+    def key(self):
+        return self._parts[-1] if self._parts else None
+
+    def child(self, path: str):
+        return Reference("/".join(self._parts + split_path(path)))
+
+    def get(self, etag=False, shallow=False):
+        _call("get")
+        value = peek(self.path)
+        if shallow and isinstance(value, dict):
+            value = {k: True for k in value}
+        return (value, _etag(value)) if etag else value
+
+    def set(self, value):
+        _call("set")
+        with _lock:
+            _write(self._parts, value)
+        _notify(self._parts)
+
+    def update(self, value: dict):
+        _call("update")
+        with _lock:
+            for key, child in value.items():
+                _write(self._parts + split_path(key), child)
+        for key in value:
+            _notify(self._parts + split_path(key))
+
+    def push(self, value=""):
+        _call("push")
+        ref = self.child(new_push_id())
+        with _lock:
+            _write(ref._parts, value)
+        _notify(ref._parts)
+        return ref
+
+    def delete(self):
+        _call("delete")
+        with _lock:
+            _write(self._parts, None)
+        _notify(self._parts)
+
+    def set_if_unchanged(self, expected_etag: str, value):
+        _call("set_if_unchanged")
+        with _lock:
+            current = copy.deepcopy(_read(self._parts))
+            if _etag(current) != expected_etag:
+                return False, current, _etag(current)
+            _write(self._parts, value)
+            current = copy.deepcopy(_read(self._parts))
+        _notify(self._parts)
+        return True, current, _etag(current)
+
+    def transaction(self, transaction_update):
+        data, etag = self.get(etag=True)
+        for _ in range(TRANSACTION_MAX_RETRIES):
+            new_value = transaction_update(data)
+            success, data, etag = self.set_if_unchanged(etag, new_value)
+            if success:
+                return new_value
+        raise TransactionAbortedError("Transaction aborted after failed retries.")
+
+    def listen(self, callback):
+        item = (self._parts, callback)
+        with _lock:
+            _listeners.append(item)
+            data = copy.deepcopy(_read(self._parts))
+        callback(Event("put", "/", data))
+        return ListenerRegistration(item)
+
+    def order_by_child(self, path: str):
+        return Query(self, path)
+
+
+def reference(path: str = "/", app=None, url=None):
+    return Reference(path)
@@ -0,0 +1,290 @@
+# ---------------------------------------------------------------------
+# 📈 Benchmarks : trafic type d'une soirée d'anniversaire
+# ---------------------------------------------------------------------
+# python -m bench.run                                # tous les scénarios, bouchon Firebase 20 ms ± 5
+# python -m bench.run --scenario hearts --latency-ms 50 --concurrency 32
+# python -m bench.run --backend sqlite               # moteur SQLite (fichier temporaire)
+# python -m bench.run --url http://localhost:5000    # serveur lancé à part (sans compte d'appels)
+# Chaque scénario rapporte p50/p95/p99 (ms), requêtes/s, codes HTTP et appels au
+# stockage par requête (écritures différées et traitement d'images compris).
+# Un 503 (file d'envoi de photos pleine) est retenté avec backoff, comme le ferait
+# le client : la latence inclut l'attente et les refus sont comptés dans "rejected".
+# Résultats écrits dans bench/results.json, clés triées : diffable d'un commit à l'autre.
+import argparse, base64, importlib, json, math, os, platform, random, sys, tempfile, threading, time
+import urllib.error, urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_REQUESTS = {"signup": 300, "hearts": 1000, "leaderboard": 1000, "gallery": 40}
+MAX_RETRIES = 30
+RETRY_BACKOFF_S = (0.05, 1.0)   # premier délai, délai maximal (doublé à chaque refus)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks des routes de l'application")
+    parser.add_argument("--scenario", action="append", choices=sorted(DEFAULT_REQUESTS),
+                        help="scénario à lancer (répétable, défaut : tous)")
+    parser.add_argument("--requests", type=int, help="nombre de requêtes par scénario (défaut propre à chacun)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--backend", choices=["fake", "sqlite"], default="fake")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="latence simulée du bouchon Firebase")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--url", help="cible HTTP externe au lieu de l'application en processus")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench", "results.json"))
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    # À faire avant d'importer app : la configuration est lue à l'import
+    if args.backend == "fake":
+        os.environ["STORAGE_BACKEND"] = "firebase"
+        os.environ["FIREBASE_DB_MODULE"] = "bench.fakedb"
+        os.environ["FAKEDB_LATENCY_MS"] = str(args.latency_ms)
+        os.environ["FAKEDB_JITTER_MS"] = str(args.jitter_ms)
+    else:
+        os.environ["STORAGE_BACKEND"] = "sqlite"
+        os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.sqlite3")
+    sys.path.insert(0, ROOT)
+
+
+# ---------- Clients ----------
+class LocalClient:
+    # Application en processus (test_client, un par thread) : pas de réseau, appels comptés.
+    # Avec le bouchon Firebase, ce sont ses allers-retours qui sont comptés (une transaction
+    # en fait au moins deux), sinon les appels au stockage vus par l'application.
+    def __init__(self, app_module, fakedb=None):
+        self.app_module = app_module
+        self.fakedb = fakedb
+        self._calls = Counter()
+        self._local = threading.local()
+        app_module.store.on_call(self._count)
+        # Même démarrage qu'en production (connexion, miroirs), hors mesures
+        app_module.create_app()
+        app_module.WARMUP_DONE.wait(30)
+
+    @property
+    def calls(self):
+        return Counter(self.fakedb.CALLS) if self.fakedb is not None else self._calls
+
+    def _count(self, op, path, seconds, payload, failed):
+        self._calls[op] += 1
+
+    def send(self, method, path, body=None, headers=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app_module.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.headers, response.get_json(silent=True)
+
+    def drain(self):
+        # Écritures différées et images en cours : comptées dans le scénario qui les a produites
+        app = self.app_module
+        slots = app.GALLERY_QUEUE_SIZE
+        for _ in range(slots):
+            app.IMAGE_SLOTS.acquire(timeout=60)
+        for _ in range(slots):
+            app.IMAGE_SLOTS.release()
+        app.WRITES.flush()
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.calls = None
+
+    def send(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=dict(headers or {}))
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                raw = response.read()
+                status, response_headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            raw, status, response_headers = e.read(), e.code, e.headers
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = None
+        return status, response_headers, payload
+
+    def drain(self):
+        pass
+
+
+# ---------- Scénarios ----------
+# setup(client, rng) prépare les données et renvoie un état ; step(client, state, i, rng)
+# envoie une requête et renvoie son code HTTP.
+def run_id():
+    return base64.b32encode(os.urandom(5)).decode().lower()
+
+
+def signup_setup(client, rng):
+    return {"run": run_id()}
+
+def signup_step(client, state, i, rng):
+    # Arrivée des invités : chacun se présente au chat (création de compte + quiz)
+    status, _, _ = client.send("POST", "/message", {"name": f"Invite{state['run']}{i}", "text": "salut"})
+    return status
+
+
+def hearts_setup(client, rng):
+    for n in range(5):
+        client.send("POST", "/wishes", {"name": f"Invité {n}", "message": "Joyeux anniversaire !"})
+    _, _, body = client.send("GET", "/wishes?limit=5")
+    return {"wish_ids": [w["id"] for w in body["wishes"]]}
+
+def hearts_step(client, state, i, rng):
+    # Tempête de coeurs : 80 % des clics sur le voeu affiché en premier
+    ids = state["wish_ids"]
+    wish_id = ids[0] if rng.random() < 0.8 else rng.choice(ids)
+    status, _, _ = client.send("POST", "/wishes/heart", {"id": wish_id})
+    return status
+
+
+def leaderboard_setup(client, rng):
+    run = run_id()
+    for n in range(100):
+        client.send("POST", "/leaderboard/score", {"name": f"Joueur{run}{n}", "delta": rng.randint(1, 50)})
+    return {"run": run, "etags": threading.local()}
+
+def leaderboard_step(client, state, i, rng):
+    # Écrans qui rafraîchissent le classement (avec leur ETag), quelques scores en parallèle
+    if rng.random() < 0.1:
+        status, _, _ = client.send("POST", "/leaderboard/score",
+                                   {"name": f"Joueur{state['run']}{rng.randrange(100)}", "delta": rng.randint(1, 5)})
+        return status
+    etag = getattr(state["etags"], "value", None)
+    status, headers, _ = client.send("GET", "/leaderboard/top?limit=10", headers={"If-None-Match": etag} if etag else None)
+    if headers.get("ETag"):
+        state["etags"].value = headers.get("ETag")
+    return status
+
+
+def gallery_setup(client, rng):
+    from PIL import Image
+    image = Image.effect_noise((1280, 960), 64).convert("RGB")
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return {"image": "data:image/jpeg;base64," + base64.b64encode(out.getvalue()).decode()}
+
+def gallery_step(client, state, i, rng):
+    # Envois de photos depuis les téléphones (traitement en arrière-plan)
+    status, _, _ = client.send("POST", "/gallery", {"image": state["image"], "caption": f"Photo {i}", "name": "Invité"})
+    return status
+
+
+SCENARIOS = {
+    "signup": (signup_setup, signup_step),
+    "hearts": (hearts_setup, hearts_step),
+    "leaderboard": (leaderboard_setup, leaderboard_step),
+    "gallery": (gallery_setup, gallery_step),
+}
+
+
+# ---------- Exécution ----------
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+
+def run_scenario(client, name: str, total: int, concurrency: int, seed: int):
+    setup, step = SCENARIOS[name]
+    state = setup(client, random.Random(seed))
+    client.drain()
+    calls_before = Counter(client.calls) if client.calls is not None else None
+    rngs = threading.local()
+
+    def one(i):
+        rng = getattr(rngs, "rng", None)
+        if rng is None:
+            rng = rngs.rng = random.Random(f"{seed}-{threading.get_ident()}")
+        started, rejected, delay = time.perf_counter(), 0, RETRY_BACKOFF_S[0]
+        while True:
+            try:
+                status = step(client, state, i, rng)
+            except Exception as e:
+                status = type(e).__name__
+            if status != 503 or rejected >= MAX_RETRIES:
+                break
+            rejected += 1
+            time.sleep(delay * (0.5 + rng.random()))
+            delay = min(delay * 2, RETRY_BACKOFF_S[1])
+        return status, time.perf_counter() - started, rejected
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    client.drain()
+
+    latencies = sorted(seconds * 1000 for _, seconds, _ in outcomes)
+    statuses = Counter(str(status) for status, _, _ in outcomes)
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "requests_per_s": round(total / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        },
+        "status": dict(sorted(statuses.items())),
+        "errors": sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 500),
+        "rejected": sum(rejected for _, _, rejected in outcomes),
+    }
+    if calls_before is not None:
+        calls = Counter(client.calls)
+        calls.subtract(calls_before)
+        calls = {op: n for op, n in sorted(calls.items()) if n}
+        result["backend_calls"] = calls
+        result["backend_calls_per_request"] = round(sum(calls.values()) / total, 2)
+    return result
+
+
+def main():
+    args = parse_args()
+    if args.url:
+        client, backend = HttpClient(args.url), "http"
+    else:
+        configure_environment(args)
+        import app as app_module
+        fakedb = importlib.import_module("bench.fakedb") if args.backend == "fake" else None
+        client, backend = LocalClient(app_module, fakedb), args.backend
+    names = args.scenario or list(SCENARIOS)
+
+    report = {
+        "config": {
+            "backend": backend,
+            "latency_ms": args.latency_ms if backend == "fake" else None,
+            "jitter_ms": args.jitter_ms if backend == "fake" else None,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "scenarios": {},
+    }
+    print(f"{'scénario':<12} {'req':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'appels/req':>11} {'refus':>6}  statuts")
+    for name in names:
+        result = run_scenario(client, name, args.requests or DEFAULT_REQUESTS[name], args.concurrency, args.seed)
+        report["scenarios"][name] = result
+        lat = result["latency_ms"]
+        print(f"{name:<12} {result['requests']:>6} {result['requests_per_s']:>8} {lat['p50']:>8} {lat['p95']:>8} "
+              f"{lat['p99']:>8} {str(result.get('backend_calls_per_request', '-')):>11} {result['rejected']:>6}  {result['status']}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
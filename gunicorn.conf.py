@@ -0,0 +1,60 @@
+# ---------------------------------------------------------------------
+# ⚙️ Configuration gunicorn (production)
+# ---------------------------------------------------------------------
+# gunicorn -c gunicorn.conf.py "app:create_app()"
+# La concurrence se règle par variables d'environnement, sans toucher au code :
+#   WEB_CONCURRENCY          nombre de processus (défaut 2)
+#   GUNICORN_THREADS         threads par processus (défaut 16)
+#   STREAM_MAX_SUBSCRIBERS   clients /stream par processus (défaut : la moitié des threads)
+#   GUNICORN_PRELOAD         "1" charge app.py une seule fois avant le fork
+# Un client /stream garde son thread tant qu'il reste connecté : le plafond laisse
+# toujours des threads libres pour les autres requêtes (au-delà : 503, le client réessaie).
+import os, signal, sys, threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+accesslog = "-" if os.getenv("GUNICORN_ACCESS_LOG", "0") == "1" else None
+
+# Lu par app.py à l'import (avant ou après le fork selon GUNICORN_PRELOAD)
+os.environ.setdefault("STREAM_MAX_SUBSCRIBERS", str(max(1, threads // 2)))
+# Préchargement : pas de connexion, de migration ni de thread dans le maître,
+# chaque worker se préchauffe dans post_fork
+if preload_app:
+    os.environ["WARM_UP_IN_WORKERS"] = "1"
+
+
+def post_fork(server, worker):
+    # Application préchargée : connexions et threads du parent à recréer dans le worker,
+    # puis préchauffage (jamais lancé dans le maître)
+    app = sys.modules.get("app")
+    if app is not None:
+        app.after_fork()
+
+
+def post_worker_init(worker):
+    # SIGTERM : les flux /stream sont fermés tout de suite, sinon le worker attendrait
+    # graceful_timeout qu'ils se terminent d'eux-mêmes avant worker_exit
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def on_term(signum, frame):
+        app = sys.modules.get("app")
+        if app is not None:
+            threading.Thread(target=app.stop_streams, name="stop-streams", daemon=True).start()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, on_term)
+
+
+def worker_exit(server, worker):
+    app = sys.modules.get("app")
+    if app is not None:
+        app.shutdown()
@@ -0,0 +1,449 @@
+# ---------------------------------------------------------------------
+# 🗄️ Moteurs de stockage
+# ---------------------------------------------------------------------
+# Interface commune aux routes (chemins "a/b/c" façon Realtime Database) :
+#   get, set, update (multi-chemins, {".sv": {"increment": n}}), push, delete,
+#   query (tri par enfant + bornes + limite), transaction, listen.
+# - FirebaseStorage : Realtime Database via firebase_admin (comportement historique)
+# - SQLiteStorage   : fichier local en WAL, pour un déploiement mono-noeud, les tests
+#                     et les benchmarks hors ligne
+import importlib, json, os, sqlite3, threading, time, secrets
+from collections import OrderedDict
+from contextlib import contextmanager
+
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+
+def new_push_id() -> str:
+    # Même format que les clés de push() : 8 caractères d'horodatage + 12 aléatoires
+    now = int(time.time() * 1000)
+    stamp = []
+    for _ in range(8):
+        stamp.append(PUSH_CHARS[now % 64])
+        now //= 64
+    return "".join(reversed(stamp)) + "".join(secrets.choice(PUSH_CHARS) for _ in range(12))
+
+def split_path(path: str):
+    return [p for p in (path or "").split("/") if p]
+
+def is_increment(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get(".sv"), dict) and "increment" in value[".sv"]
+
+
+class Storage:
+    name = "base"
+    supports_listen = False
+
+    def get(self, path: str):
+        raise NotImplementedError
+
+    def set(self, path: str, value):
+        raise NotImplementedError
+
+    def update(self, path: str, values: dict):
+        raise NotImplementedError
+
+    def push(self, path: str, value) -> str:
+        raise NotImplementedError
+
+    def delete(self, path: str):
+        raise NotImplementedError
+
+    def query(self, path: str, order_by: str, start_at=None, end_at=None, equal_to=None,
+              limit_to_first: int = None, limit_to_last: int = None) -> OrderedDict:
+        raise NotImplementedError
+
+    def transaction(self, path: str, update_fn):
+        raise NotImplementedError
+
+    def listen(self, path: str, callback):
+        raise NotImplementedError(f"listen() non disponible avec le moteur {self.name}")
+
+    def ping(self):
+        # Lecture minimale, utilisée par /ready
+        self.get("_ping")
+
+    def after_fork(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# ---------- Firebase Realtime Database ----------
+class FirebaseStorage(Storage):
+    name = "firebase"
+    supports_listen = True
+
+    def __init__(self, credential, database_url: str, db_module: str = None):
+        # credential : chemin du fichier de clé ou contenu JSON déjà chargé (dict).
+        # db_module : module exposant reference(path) à la place de firebase_admin.db
+        # (bouchon local des benchmarks, émulateur...), sans initialisation firebase_admin.
+        self.credential = credential
+        self.database_url = database_url
+        self.db_module = db_module
+        self._init_app()
+
+    def _init_app(self):
+        if self.db_module:
+            self._db = importlib.import_module(self.db_module)
+            return
+        import firebase_admin
+        from firebase_admin import credentials, db
+        try:
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(credentials.Certificate(self.credential), {"databaseURL": self.database_url})
+        self._db = db
+
+    def after_fork(self):
+        # Sessions HTTP et jeton d'accès hérités du parent : chaque worker recrée son app
+        if self.db_module:
+            return
+        import firebase_admin
+        try:
+            firebase_admin.delete_app(firebase_admin.get_app())
+        except ValueError:
+            pass
+        self._init_app()
+
+    def ref(self, path: str):
+        return self._db.reference("/" + "/".join(split_path(path)))
+
+    def get(self, path):
+        return self.ref(path).get()
+
+    def set(self, path, value):
+        self.ref(path).set(value)
+
+    def update(self, path, values):
+        self.ref(path).update(values)
+
+    def push(self, path, value):
+        return self.ref(path).push(value).key
+
+    def delete(self, path):
+        self.ref(path).delete()
+
+    def query(self, path, order_by, start_at=None, end_at=None, equal_to=None,
+              limit_to_first=None, limit_to_last=None):
+        query = self.ref(path).order_by_child(order_by)
+        if start_at is not None:
+            query = query.start_at(start_at)
+        if end_at is not None:
+            query = query.end_at(end_at)
+        if equal_to is not None:
+            query = query.equal_to(equal_to)
+        if limit_to_first is not None:
+            query = query.limit_to_first(limit_to_first)
+        if limit_to_last is not None:
+            query = query.limit_to_last(limit_to_last)
+        return query.get() or OrderedDict()
+
+    def transaction(self, path, update_fn):
+        return self.ref(path).transaction(update_fn)
+
+    def listen(self, path, callback):
+        return self.ref(path).listen(callback)
+
+
+# ---------- SQLite ----------
+# Une ligne par feuille de l'arbre JSON : "users/<id>/name" -> "Alice".
+# base/child/field découpent le chemin pour les requêtes triées par enfant
+# (users + name, leaderboard + score, wishes + created_at...), couvertes par l'index
+# nodes_order ; le préfixe de chemin (clé primaire) sert les lectures de sous-arbre.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    path  TEXT PRIMARY KEY,
+    base  TEXT NOT NULL,
+    child TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    num   REAL,
+    txt   TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS nodes_order ON nodes (base, field, num, txt, child);
+"""
+
+
+def flatten(path: str, value, out: list):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            flatten(f"{path}/{key}" if path else str(key), child, out)
+    elif isinstance(value, (list, tuple)):
+        for index, child in enumerate(value):
+            flatten(f"{path}/{index}" if path else str(index), child, out)
+    elif value is not None:
+        out.append(path)
+        out.append(value)
+    return out
+
+def as_tree(node):
+    # Comme Firebase : un objet aux clés 0..n-1 est renvoyé sous forme de liste
+    if not isinstance(node, dict):
+        return node
+    node = {k: as_tree(v) for k, v in node.items()}
+    if node and all(k.isdigit() for k in node) and sorted(int(k) for k in node) == list(range(len(node))):
+        return [node[str(i)] for i in range(len(node))]
+    return node
+
+def leaf_row(path: str, value):
+    segs = path.split("/")
+    num = value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    txt = value if isinstance(value, str) else None
+    child = segs[-2] if len(segs) > 1 else ""
+    return (path, "/".join(segs[:-2]), child, segs[-1], json.dumps(value), num, txt)
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._local = threading.local()
+        self.conn().executescript(SCHEMA)
+
+    def conn(self):
+        # Une connexion par thread, recréée après un fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def write(self):
+        conn = self.conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _read(self, conn, path: str):
+        if not path:
+            rows = conn.execute("SELECT path, value FROM nodes")
+        else:
+            rows = conn.execute(
+                "SELECT path, value FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+                (path, path + "/", path + "0"),
+            )
+        tree, found = {}, False
+        for row_path, raw in rows:
+            found = True
+            value = json.loads(raw)
+            if row_path == path:
+                return value
+            segs = row_path[len(path) + 1:].split("/") if path else row_path.split("/")
+            node = tree
+            for seg in segs[:-1]:
+                node = node.setdefault(seg, {})
+            node[segs[-1]] = value
+        return as_tree(tree) if found else None
+
+    def _delete(self, conn, path: str):
+        if not path:
+            conn.execute("DELETE FROM nodes")
+            return
+        conn.execute(
+            "DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+            (path, path + "/", path + "0"),
+        )
+
+    def _set(self, conn, path: str, value):
+        segs = split_path(path)
+        path = "/".join(segs)
+        if is_increment(value):
+            current = self._read(conn, path)
+            value = (current if isinstance(current, (int, float)) else 0) + value[".sv"]["increment"]
+        self._delete(conn, path)
+        # Une feuille ancêtre (valeur scalaire) est remplacée par le nouvel objet
+        ancestors = ["/".join(segs[:i]) for i in range(1, len(segs))]
+        if ancestors:
+            conn.execute(f"DELETE FROM nodes WHERE path IN ({','.join('?' * len(ancestors))})", ancestors)
+        flat = flatten(path, value, [])
+        rows = [leaf_row(flat[i], flat[i + 1]) for i in range(0, len(flat), 2)]
+        conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def get(self, path):
+        return self._read(self.conn(), "/".join(split_path(path)))
+
+    def set(self, path, value):
+        with self.write() as conn:
+            self._set(conn, path, value)
+
+    def update(self, path, values):
+        if not values or not isinstance(values, dict):
+            raise ValueError("Value argument must be a non-empty dictionary.")
+        base = "/".join(split_path(path))
+        with self.write() as conn:
+            for key, value in values.items():
+                self._set(conn, f"{base}/{key}" if base else key, value)
+
+    def push(self, path, value):
+        key = new_push_id()
+        base = "/".join(split_path(path))
+        self.set(f"{base}/{key}" if base else key, value)
+        return key
+
+    def delete(self, path):
+        with self.write() as conn:
+            self._delete(conn, "/".join(split_path(path)))
+
+    def query(self, path, order_by, start_at=None, end_at=None, equal_to=None,
+              limit_to_first=None, limit_to_last=None):
+        # Ordre : nombres (num) puis chaînes (txt), départage par clé
+        base = "/".join(split_path(path))
+        where, params = ["base = ?", "field = ?"], [base, order_by]
+        for bound, op in ((start_at, ">="), (end_at, "<="), (equal_to, "=")):
+            if bound is None:
+                continue
+            if isinstance(bound, str):
+                where.append(f"txt {op} ?" if op != "<=" else "(num IS NOT NULL OR txt <= ?)")
+            else:
+                where.append(f"num {op} ?" if op != ">=" else "(num >= ? OR txt IS NOT NULL)")
+            params.append(bound)
+        sql = f"SELECT child FROM nodes WHERE {' AND '.join(where)}"
+        if limit_to_last is not None:
+            sql += " ORDER BY num DESC, txt DESC, child DESC LIMIT ?"
+            params.append(limit_to_last)
+        else:
+            sql += " ORDER BY num, txt, child"
+            if limit_to_first is not None:
+                sql += " LIMIT ?"
+                params.append(limit_to_first)
+        conn = self.conn()
+        children = [row[0] for row in conn.execute(sql, params)]
+        if limit_to_last is not None:
+            children.reverse()
+        return OrderedDict((c, self._read(conn, f"{base}/{c}" if base else c)) for c in children)
+
+    def transaction(self, path, update_fn):
+        with self.write() as conn:
+            new_value = update_fn(self._read(conn, "/".join(split_path(path))))
+            self._set(conn, path, new_value)
+        return new_value
+
+    def ping(self):
+        self.conn().execute("SELECT 1")
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# ---------- Observation des écritures ----------
+def join_path(base: str, key: str) -> str:
+    return "/".join(split_path(base) + split_path(key))
+
+
+class ObservedStorage(Storage):
+    # Enveloppe un moteur et signale les chemins écrits aux abonnés (versions de noeuds, caches...).
+    # Le moteur n'est construit qu'au premier accès (ou par connect()) : importer
+    # firebase_admin et ouvrir la connexion ne ralentit pas le démarrage.
+    def __init__(self, engine_class, factory):
+        self.name = engine_class.name
+        self.supports_listen = engine_class.supports_listen
+        self._factory = factory
+        self._engine = None
+        self._engine_lock = threading.Lock()
+        self._write_listeners = []
+        self._call_listeners = []
+
+    @property
+    def engine(self) -> Storage:
+        if self._engine is None:
+            with self._engine_lock:
+                if self._engine is None:
+                    self._engine = self._factory()
+        return self._engine
+
+    def connect(self):
+        self.engine.ping()
+
+    def on_write(self, callback):
+        self._write_listeners.append(callback)
+        return callback
+
+    def on_call(self, callback):
+        # callback(op, path, seconds, payload, failed) après chaque appel au moteur ;
+        # payload = valeur lue (get, query, transaction) ou écrite (set, update, push)
+        self._call_listeners.append(callback)
+        return callback
+
+    def _written(self, paths):
+        for callback in self._write_listeners:
+            callback(paths)
+
+    def _call(self, op, path, method, *args, payload=None):
+        started = time.perf_counter()
+        result, failed = None, True
+        try:
+            result = method(path, *args)
+            failed = False
+            return result
+        finally:
+            if self._call_listeners:
+                seconds = time.perf_counter() - started
+                for callback in self._call_listeners:
+                    callback(op, path, seconds, result if payload is None else payload, failed)
+
+    def get(self, path):
+        return self._call("get", path, self.engine.get)
+
+    def query(self, path, order_by, **options):
+        return self._call("query", path, lambda p: self.engine.query(p, order_by, **options))
+
+    def set(self, path, value):
+        self._call("set", path, self.engine.set, value, payload=value)
+        self._written([join_path(path, "")])
+
+    def update(self, path, values):
+        self._call("update", path, self.engine.update, values, payload=values)
+        self._written([join_path(path, key) for key in values])
+
+    def push(self, path, value):
+        key = self._call("push", path, self.engine.push, value, payload=value)
+        self._written([join_path(path, key)])
+        return key
+
+    def delete(self, path):
+        self._call("delete", path, self.engine.delete)
+        self._written([join_path(path, "")])
+
+    def transaction(self, path, update_fn):
+        result = self._call("transaction", path, self.engine.transaction, update_fn)
+        self._written([join_path(path, "")])
+        return result
+
+    def listen(self, path, callback):
+        return self.engine.listen(path, callback)
+
+    def ping(self):
+        self._call("ping", "", lambda p: self.engine.ping())
+
+    def after_fork(self):
+        self._engine_lock = threading.Lock()
+        if self._engine is not None:
+            self._engine.after_fork()
+
+    def close(self):
+        if self._engine is not None:
+            self._engine.close()
+
+
+def create_storage(backend: str, **options) -> Storage:
+    if backend == "firebase":
+        return ObservedStorage(FirebaseStorage, lambda: FirebaseStorage(
+            options["credential"], options["database_url"], options.get("firebase_db_module")))
+    if backend == "sqlite":
+        return ObservedStorage(SQLiteStorage, lambda: SQLiteStorage(options["sqlite_path"]))
+    raise ValueError(f"STORAGE_BACKEND inconnu : {backend}")
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+# L'app lit sa configuration à l'import : SQLite local, écritures synchrones, pas de relais
+os.environ.update({
+    "STORAGE_BACKEND": "sqlite",
+    "SQLITE_PATH": os.path.join(tempfile.mkdtemp(prefix="anniv-tests-"), "anniv.sqlite3"),
+    "WRITE_BEHIND_MS": "0",
+    "STREAM_RELAY": "0",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as anniv
+
+
+@pytest.fixture
+def client():
+    # Base vide et caches en mémoire vidés entre chaque test
+    anniv.store.delete("/")
+    anniv._migrations_done.clear()
+    for value in vars(anniv).values():
+        if isinstance(value, anniv.TTLCache):
+            value.clear()
+    anniv.WRITES.after_fork()
+    anniv.run_migrations()
+    return anniv.app.test_client()
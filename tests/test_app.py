@@ -0,0 +1,157 @@
+import app as anniv
+
+
+def collect_pages(client, url, param, key):
+    items, cursor = [], None
+    while True:
+        query = {"limit": 2}
+        if cursor:
+            query[param] = cursor
+        body = client.get(url, query_string=query).get_json()
+        items.extend(body[key])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return items
+
+
+def test_wishes_pages_newest_first(client):
+    created = ["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03", "2024-01-04"]
+    for index, created_at in enumerate(created):
+        anniv.store.set(f"wishes/w{index}", {"name": "Ana", "message": str(index), "hearts": 0, "created_at": created_at})
+    wishes = collect_pages(client, "/wishes", "before", "wishes")
+    # Même date : départage par clé, sans doublon ni trou entre les pages
+    assert [w["id"] for w in wishes] == ["w4", "w3", "w2", "w1", "w0"]
+
+
+def test_quiz_questions_page_oldest_first(client):
+    for index in range(5):
+        anniv.store.set(f"quiz/questions/q{index}", {"question": str(index), "created_at": f"2024-01-0{index + 1}"})
+    questions = collect_pages(client, "/quiz/questions", "after", "questions")
+    assert [q["id"] for q in questions] == ["q0", "q1", "q2", "q3", "q4"]
+
+
+def test_wishes_etag_revalidation(client):
+    client.post("/wishes", json={"name": "Ana", "message": "Joyeux anniversaire"})
+    first = client.get("/wishes")
+    etag = first.headers["ETag"]
+    assert client.get("/wishes", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/wishes", json={"name": "Léo", "message": "Bravo"})
+    changed = client.get("/wishes", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert len(changed.get_json()["wishes"]) == 2
+
+
+def test_vote_switch_moves_the_count(client):
+    client.post("/polls/cake", json={"action": "create", "question": "Gâteau ?", "options": ["Choco", "Vanille"]})
+
+    def vote(name, option_id):
+        return client.post("/polls/cake", json={"action": "vote", "name": name, "option_id": option_id})
+
+    def counts():
+        return client.get("/polls/cake").get_json()["poll"]["counts"]
+
+    assert vote("Ana", "opt1").status_code == 200
+    assert counts() == {"opt1": 1, "opt2": 0}
+    vote("Ana", "opt2")
+    assert counts() == {"opt1": 0, "opt2": 1}
+    vote("Ana", "opt2")
+    vote("Léo", "opt2")
+    assert counts() == {"opt1": 0, "opt2": 2}
+    assert vote("Ana", "opt9").status_code == 400
+    assert counts() == {"opt1": 0, "opt2": 2}
+
+
+def test_batch_returns_one_result_per_op(client):
+    client.post("/wishes", json={"name": "Ana", "message": "Coucou"})
+    wish_id = client.get("/wishes").get_json()["wishes"][0]["id"]
+    client.post("/polls/cake", json={"action": "create", "question": "Gâteau ?", "options": ["Choco", "Vanille"]})
+
+    body = client.post("/batch", json={"name": "Ana", "ops": [
+        {"op": "score", "delta": 3},
+        {"op": "score", "delta": 2},
+        {"op": "memory_best", "best_time_ms": 4200},
+        {"op": "vote", "poll_id": "cake", "option_id": "opt2"},
+        {"op": "vote", "poll_id": "cake", "option_id": "opt7"},
+        {"op": "heart", "id": wish_id},
+        {"op": "quiz_score", "score": 2, "total": 3},
+        {"op": "dance"},
+    ]}).get_json()
+    results = body["results"]
+
+    assert body["ok"] is False
+    assert [r["entry"]["score"] for r in results[:2]] == [3, 5]
+    assert results[2] == {"ok": True, "best_time_ms": 4200}
+    assert results[3] == {"ok": True}
+    assert results[4] == {"ok": False, "error": "unknown option"}
+    assert results[5] == {"ok": True, "hearts": 1}
+    assert results[6]["ok"] and anniv.store.get(f"quiz/scores/{results[6]['score_id']}")["score"] == 2
+    assert results[7] == {"ok": False, "error": "unknown op: dance"}
+
+    user_id = results[0]["entry"]["user_id"]
+    assert anniv.store.get(f"leaderboard/{user_id}/score") == 5
+    assert anniv.store.get(f"games/memory/{user_id}/best_time_ms") == 4200
+    assert anniv.store.get(f"wishes/{wish_id}/hearts") == 1
+    assert client.get("/polls/cake").get_json()["poll"]["counts"] == {"opt1": 0, "opt2": 1}
+
+
+def test_batch_rejects_empty_ops(client):
+    assert client.post("/batch", json={"name": "Ana", "ops": []}).status_code == 400
+
+
+def test_quiz_state_machine(client):
+    quiz = anniv.celebrant_content(anniv.DEFAULT_CELEBRANT)[1]
+
+    def say(text):
+        return client.post("/message", json={"name": "Ana", "text": text}).get_json()["replies"]
+
+    welcome = say("bonjour")
+    assert welcome[0] == "Bienvenue Ana !" and welcome[-1] == quiz[0]["question"]
+    assert say(quiz[0]["answer"]) == ["Bonne réponse !", quiz[1]["question"]]
+    assert say("z")[1] == quiz[2]["question"]
+    done = say(quiz[2]["answer"])
+    assert done[0] == "Excellent ! 🎉" and "Score : 2/3" in done[1]
+    assert say("b") == [anniv.ALREADY_PLAYED]
+
+    user_id = anniv.get_user_id_by_name("Ana")
+    assert anniv.store.get(f"users/{user_id}")["step"] == "done"
+    assert say("rejouer") == ["C'est reparti !", quiz[0]["question"]]
+    assert anniv.store.get(f"users/{user_id}")["score"] == 0
+
+
+def test_quiz_follows_progress_made_elsewhere(client):
+    quiz = anniv.celebrant_content(anniv.DEFAULT_CELEBRANT)[1]
+    client.post("/message", json={"name": "Ana", "text": "bonjour"})
+    user_id = anniv.get_user_id_by_name("Ana")
+    # Un autre worker a déjà corrigé la première question
+    anniv.update_user(user_id, {"step": "quiz_q2", "score": 1})
+    replies = client.post("/message", json={"name": "Ana", "text": quiz[1]["answer"]}).get_json()["replies"]
+    assert replies == ["Bravo !", quiz[2]["question"]]
+    assert anniv.store.get(f"users/{user_id}")["score"] == 2
+
+
+def test_client_ids_cannot_escape_their_node(client):
+    body = client.post("/batch", json={"name": "Ana", "ops": [
+        {"op": "vote", "poll_id": "cake/../users", "option_id": "opt1"},
+        {"op": "vote", "poll_id": "cake", "option_id": "opt.1"},
+        {"op": "heart", "id": "w1/hearts"},
+        {"op": "heart", "id": "w#1"},
+    ]}).get_json()
+    assert [r["ok"] for r in body["results"]] == [False] * 4
+    assert client.post("/wishes/heart", json={"id": "w[1]"}).status_code == 400
+    assert client.post("/polls/cake.1", json={"action": "vote", "name": "Ana", "option_id": "opt1"}).status_code == 400
+    assert anniv.store.get("/") == {"meta": anniv.store.get("meta")}
+
+
+def test_finished_quiz_sees_replay_from_another_worker(client):
+    quiz = anniv.celebrant_content(anniv.DEFAULT_CELEBRANT)[1]
+
+    def say(text):
+        return client.post("/message", json={"name": "Ana", "text": text}).get_json()["replies"]
+
+    say("bonjour")
+    for question in quiz:
+        say(question["answer"])
+    assert say("b") == [anniv.ALREADY_PLAYED]
+    # 'rejouer' traité par un autre worker : la session en cache ici dit encore "done"
+    anniv.update_user(anniv.get_user_id_by_name("Ana"), {"step": "quiz_q1", "score": 0})
+    assert say(quiz[0]["answer"]) == ["Bonne réponse !", quiz[1]["question"]]
@@ -0,0 +1,41 @@
+from storage import SQLiteStorage
+
+
+def increment(delta):
+    return {".sv": {"increment": delta}}
+
+
+def test_update_applies_server_increments(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    store.set("wishes/w1", {"hearts": 2, "name": "Ana"})
+    store.update("/", {
+        "wishes/w1/hearts": increment(3),
+        "wishes/w2/hearts": increment(1),
+        "polls/p1/counts/opt1": increment(-1),
+    })
+    assert store.get("wishes/w1") == {"hearts": 5, "name": "Ana"}
+    assert store.get("wishes/w2/hearts") == 1
+    assert store.get("polls/p1/counts/opt1") == -1
+
+
+def test_update_increments_relative_to_base_path(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    store.set("leaderboard/u1", {"name": "Ana", "score": 10})
+    store.update("leaderboard/u1", {"score": increment(5), "name": "Anaïs"})
+    assert store.get("leaderboard/u1") == {"name": "Anaïs", "score": 15}
+
+
+def test_query_orders_and_limits(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    for user_id, score in (("a", 3), ("b", 10), ("c", 7), ("d", 1)):
+        store.set(f"leaderboard/{user_id}", {"score": score})
+    assert list(store.query("leaderboard", "score", limit_to_last=2)) == ["c", "b"]
+    assert list(store.query("leaderboard", "score", start_at=3, limit_to_first=2)) == ["a", "c"]
+
+
+def test_transaction_reads_and_writes(tmp_path):
+    store = SQLiteStorage(str(tmp_path / "db.sqlite3"))
+    store.set("users/u1", {"step": "quiz_q1", "score": 0})
+    result = store.transaction("users/u1", lambda user: dict(user, step="quiz_q2", score=user["score"] + 1))
+    assert result == {"step": "quiz_q2", "score": 1}
+    assert store.get("users/u1") == result